@@ -38,6 +38,46 @@ job "j-yabot-new" {
     }
     count = 1
 
+    network {
+      port "http" {
+        to = 8080
+      }
+    }
+
+    service {
+      name = "yabot"
+      port = "http"
+
+      # Готовность: AD, каталог Yandex 360 и опрос обновлений бота
+      check {
+        name     = "yabot-ready"
+        type     = "http"
+        path     = "/readyz"
+        interval = "15s"
+        timeout  = "3s"
+      }
+
+      check {
+        name     = "yabot-alive"
+        type     = "http"
+        path     = "/healthz"
+        interval = "30s"
+        timeout  = "3s"
+
+        check_restart {
+          limit = 3
+          grace = "120s"
+        }
+      }
+    }
+
+    # Кэш каталогов (WARM_CACHE_PATH) переносится в новую аллокацию при деплое
+    ephemeral_disk {
+      sticky  = true
+      migrate = true
+      size    = 300
+    }
+
     task "t-yabot-new" {
       driver = "docker"
       meta {
@@ -46,6 +86,7 @@ job "j-yabot-new" {
       config {
         image = "${var.app_image}"
         force_pull = "true"
+        ports = ["http"]
       }
       template {
         data = "${var.yabot-data-env}"
@@ -1,8 +1,13 @@
+from typing import List
+
+from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
     YANDEX_BOT_TOKEN: str
+    # Файл SQLite со снимками каталогов AD и Yandex 360 для быстрого старта
+    WARM_CACHE_PATH: str = "/alloc/data/yabot_cache.sqlite3"
 
     AD_SERVER: str
     AD_USER: str
@@ -10,9 +15,129 @@ class Settings(BaseSettings):
     AD_BASE_DN: str
     AD_USER_FOR_PASS_CHANGE: str
     AD_PASSWORD_FOR_PASS_CHANGE: str
+    # Пулы LDAP-соединений: размеры, время простоя до пересоздания и проверки (в секундах)
+    AD_POOL_SIZE: int = 4
+    AD_PASSWORD_POOL_SIZE: int = 1
+    AD_POOL_MAX_IDLE: int = 300
+    AD_POOL_HEALTH_CHECK_INTERVAL: int = 30
+    AD_POOL_ACQUIRE_TIMEOUT: int = 10
+    AD_RECEIVE_TIMEOUT: int = 15
+    # Контроллеры домена для lastLogon: список через запятую или DNS SRV домена
+    # (по умолчанию домен берётся из AD_BASE_DN), таймаут ответа одного DC (в секундах)
+    AD_DC_ADDRESSES: str = ""
+    AD_DOMAIN: str = ""
+    AD_DC_DISCOVERY_TTL: int = 60 * 60
+    AD_DC_TIMEOUT: int = 5
+    AD_DC_POOL_SIZE: int = 2
+    AD_DC_MAX_WORKERS: int = 8
+    # Снимок схемы AD на диске и его максимальный возраст (в секундах)
+    AD_SCHEMA_CACHE_DIR: str = "/local/ad_schema"
+    AD_SCHEMA_SNAPSHOT_MAX_AGE: int = 7 * 24 * 60 * 60
+    # Группы AD, членство в которых проверяет бот (с учётом вложенных групп),
+    # и время жизни снимка их состава (в секундах)
+    AD_ADMIN_GROUP_DN: str = "CN=IT,OU=Security Groups,OU=MyBusiness,DC=test,DC=local"
+    AD_SUPPORT_GROUP_DN: str = "CN=IT Техническая поддержка,OU=Security Groups,OU=MyBusiness,DC=tion,DC=local"
+    AD_GROUP_INDEX_TTL: int = 300
+    # Кэш проверки админских прав: размер, время жизни и сколько ещё отдавать
+    # устаревший ответ, пока он обновляется в фоне (в секундах)
+    AD_ADMIN_CACHE_SIZE: int = 1000
+    AD_ADMIN_CACHE_TTL: int = 60 * 60
+    AD_ADMIN_CACHE_STALE_TTL: int = 60 * 60
+    # Локальная копия пользователей AD: период инкрементальной синхронизации,
+    # период полной перезагрузки (удаляет удалённые учётки), возраст, после которого
+    # запросы снова идут в AD напрямую (в секундах), размер страницы выгрузки
+    AD_STORE_SYNC_INTERVAL: int = 60
+    AD_STORE_FULL_SYNC_INTERVAL: int = 6 * 60 * 60
+    AD_STORE_MAX_AGE: int = 15 * 60
+    AD_STORE_PAGE_SIZE: int = 1000
+    # Кэш сопоставления логина мессенджера с учётной записью AD: найденные и
+    # ненайденные логины (в секундах)
+    AD_LOGIN_CACHE_TTL: int = 60 * 60
+    AD_LOGIN_NEGATIVE_TTL: int = 5 * 60
+    # Сколько логинов объединять в один OR-фильтр при пакетном поиске
+    AD_BATCH_SIZE: int = 50
 
     API_TOKEN_360: str
     ORG_ID: int
+    # Каталог пользователей Yandex 360: размер страницы и время жизни снимка (в секундах)
+    YA360_DIRECTORY_PAGE_SIZE: int = 1000
+    YA360_DIRECTORY_TTL: int = 300
+    # HTTP-клиент API 360: таймауты (в секундах) и повторы
+    YA360_CONNECT_TIMEOUT: float = 3.0
+    YA360_READ_TIMEOUT: float = 10.0
+    YA360_DIRECTORY_READ_TIMEOUT: float = 30.0
+    YA360_RETRIES: int = 3
+    YA360_BACKOFF_FACTOR: float = 0.5
+    # Общий лимит запросов к API 360 (запросов в секунду и размер всплеска)
+    YA360_RATE_LIMIT: float = 10.0
+    YA360_RATE_BURST: int = 20
+    # Асинхронный клиент API 360: число одновременных запросов и таймаут синхронного фасада
+    YA360_CONCURRENCY: int = 20
+    YA360_SYNC_TIMEOUT: float = 60.0
+    # Аудит 2FA: время жизни кэша подтверждённых статусов (в секундах), параллелизм, чат для отчёта,
+    # ежедневное время запуска (по часам сервера, UTC) и срок одного аудита (в секундах)
+    YA360_2FA_CACHE_TTL: int = 6 * 60 * 60
+    YA360_2FA_AUDIT_CONCURRENCY: int = 10
+    YA360_2FA_AUDIT_CHAT_ID: str = ""
+    YA360_2FA_AUDIT_AT: str = "08:30"
+    YA360_2FA_AUDIT_TIMEOUT: float = 30 * 60
+
+    # Отправка сообщений ботом: общий лимит (сообщений в секунду), всплеск и сколько
+    # секунд поток ждёт отправки через цикл asyncio
+    BOT_SEND_RATE: float = 5.0
+    BOT_SEND_BURST: int = 10
+    BOT_SEND_TIMEOUT: float = 60.0
+    # Обработчики сообщений: рабочие потоки и предел очереди необработанных сообщений
+    BOT_HANDLER_WORKERS: int = 16
+    BOT_HANDLER_QUEUE_SIZE: int = 1000
+    # Режим работы бота: "threads" (опрос в потоке) или "asyncio" (опрос и отправка
+    # через aiohttp), и сколько обновлений забирать за один запрос в режиме asyncio
+    BOT_RUNTIME: str = "threads"
+    BOT_POLL_LIMIT: int = 10
+    # Состояние сценариев бота: хранилище ("memory" или "sqlite"), время жизни
+    # без активности (в секундах), максимум сессий и файл для хранилища sqlite,
+    # который использует только один процесс бота
+    SESSION_BACKEND: str = "memory"
+    SESSION_TTL: int = 900
+    SESSION_MAX_SIZE: int = 10000
+    SESSION_PATH: str = "/alloc/data/yabot_sessions.sqlite3"
+    # HTTP-сервер проверок и метрик: порт и сколько секунд без успешного опроса
+    # обновлений или обращения к AD бот считается неготовым
+    HEALTH_PORT: int = 8080
+    HEALTH_POLL_MAX_AGE: int = 60
+    HEALTH_AD_MAX_AGE: int = 60
+    # Уведомления о паролях: за сколько дней до истечения (через запятую), рабочие
+    # потоки, попытки отправки, экспоненциальная пауза между ними (в секундах)
+    # и размер списка неотправленных
+    NOTIFY_THRESHOLDS: str = "7,3,1"
+    NOTIFY_WORKERS: int = 4
+    NOTIFY_MAX_ATTEMPTS: int = 5
+    NOTIFY_BACKOFF_BASE: float = 2.0
+    NOTIFY_BACKOFF_MAX: float = 300.0
+    NOTIFY_DEAD_LETTER_SIZE: int = 1000
+    # Журнал уведомлений на диске и сколько дней хранить записи после истечения пароля
+    NOTIFY_JOURNAL_PATH: str = "/alloc/data/yabot_notifications.sqlite3"
+    NOTIFY_JOURNAL_KEEP_DAYS: int = 30
+    # Ежедневная проверка паролей (по часам сервера, UTC) и случайная задержка
+    # ежедневных задач планировщика (в секундах)
+    PASSWORD_CHECK_AT: str = "09:00"
+    SCHEDULER_JITTER: int = 60
+
+    @field_validator("NOTIFY_THRESHOLDS")
+    @classmethod
+    def _check_notify_thresholds(cls, value: str) -> str:
+        try:
+            thresholds = [int(threshold) for threshold in value.split(",") if threshold.strip()]
+        except ValueError:
+            raise ValueError("NOTIFY_THRESHOLDS: ожидаются целые числа через запятую")
+        if not thresholds or min(thresholds) < 1:
+            raise ValueError("NOTIFY_THRESHOLDS: нужен хотя бы один порог, не меньше 1 дня")
+        return value
+
+    @property
+    def notify_thresholds(self) -> List[int]:
+        """Password notification thresholds in days, ascending."""
+        return sorted({int(threshold) for threshold in self.NOTIFY_THRESHOLDS.split(",") if threshold.strip()})
 
     model_config = SettingsConfigDict(env_file="/local/.env", extra="ignore")
 
@@ -8,4 +8,17 @@ class Has2FAException(Exception):
     detail = "2FA error"
 
     def __init__(self, *args, **kwargs):
-        super().__init__(self.detail, *args, **kwargs)
\ No newline at end of file
+        super().__init__(self.detail, *args, **kwargs)
+
+class RateLimitException(Exception):
+    detail = "API 360 rate limit exceeded"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(self.detail, *args, **kwargs)
+
+class BotApiException(Exception):
+    detail = "Bot API request failed"
+
+    def __init__(self, status: int, *args, **kwargs):
+        self.status = status
+        super().__init__(self.detail, status, *args, **kwargs)
@@ -5,12 +5,18 @@ import sys
 import threading
 import time
 import requests
-import schedule
-from yandex_bot import Client, Message
+from yandex_bot import Message
 from services.ad_service import ADConnector
+from services.bot_async import AsyncBotRuntime
+from services.bot_client import DispatchingClient, messenger_limiter
+from services.health import HealthServer, MetricsWriter
 from services.utils import Utilities
-from services.yandex_service import Yandex360
+from services.yandex_async import AsyncYandex360, SyncYandex360
+from services.notification_journal import NotificationJournal
 from services.password_checker import PasswordExpiryChecker
+from services.scheduler import Scheduler
+from services.session_store import create_session_store
+from services.warm_cache import WarmCache
 
 sys.path.append(str(Path(__file__).parent.parent))
 
@@ -18,13 +24,18 @@ from config import settings
 from templates.messages import Template
 from templates.menu import MenuTemplate
 
-bot = Client(settings.YANDEX_BOT_TOKEN)
-ya360 = Yandex360()
+# Обработчики выполняются в пуле потоков, сообщения одного пользователя - по порядку
+bot = DispatchingClient(settings.YANDEX_BOT_TOKEN)
+warm_cache = WarmCache(settings.WARM_CACHE_PATH)
+ya360 = SyncYandex360(AsyncYandex360(warm_cache=warm_cache))
 utils = Utilities()
-ad = ADConnector(ya360, utils)
+ad = ADConnector(ya360, utils, warm_cache)
+scheduler = Scheduler(warm_cache)
 
-template = Template(bot, ya360, utils, ad)
-menu = MenuTemplate(bot, ya360, utils, ad)
+# Общие сессии: «Отмена» в меню сбрасывает сценарий, начатый в Template
+sessions = create_session_store(transient=("password",))
+template = Template(bot, ya360, utils, ad, sessions)
+menu = MenuTemplate(bot, ya360, utils, ad, sessions)
 
 passchecker = PasswordExpiryChecker(bot, ad, utils)
 
@@ -105,6 +116,10 @@ def command_start(message):
 def command_start(message):
     template.show_yandex_blocked_users(message.user.login)
 
+@bot.on_message(phrase="yandex_2fa_audit")
+def command_start(message):
+    template.show_2fa_audit(message.user.login)
+
 @bot.on_message(phrase="send_idea")
 def command_start(message):
     bot.send_message("Распишите вашу идею или опишите баг с которым столкнулись", message.user.login)
@@ -117,29 +132,22 @@ def send_idea_finally(message):
     template.send_idea_finally(message)
 
 def run_password_checker(bot, ad_connector, utilities):
-    """Запускает проверку паролей в отдельном потоке"""
-    checker = PasswordExpiryChecker(bot, ad_connector, utilities)
-    
-    # Поток для обработки очереди уведомлений
-    notification_thread = threading.Thread(
-        target=checker.process_notification_queue,
-        daemon=True
+    """Запускает отправку уведомлений и ставит проверку паролей в расписание"""
+    checker = PasswordExpiryChecker(
+        bot, ad_connector, utilities, NotificationJournal(settings.NOTIFY_JOURNAL_PATH)
     )
-    notification_thread.start()
     
-    # Планировщик проверки паролей
-    schedule.every().day.at("09:00").do(checker.check_expiring_passwords)
+    # Пул потоков для обработки очереди уведомлений, начинаем с неотправленных до перезапуска
+    checker.resume_pending()
+    notification_threads = checker.start_workers()
     
-    # Поток для планировщика
-    def run_scheduler():
-        while True:
-            schedule.run_pending()
-            time.sleep(60)
-    
-    scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
-    scheduler_thread.start()
+    # Проверка паролей; пропущенная из-за перезапуска выполнится при старте
+    scheduler.add_daily_job(
+        "password_expiry", checker.check_expiring_passwords, settings.PASSWORD_CHECK_AT,
+        jitter=settings.SCHEDULER_JITTER
+    )
     
-    return checker, notification_thread, scheduler_thread
+    return checker, notification_threads
 
 def run_test_check(checker):
     """Запускает тестовую проверку паролей"""
@@ -150,6 +158,91 @@ def run_test_check(checker):
     checker.notification_queue.join()
     print("Тестовая проверка завершена")
 
+def collect_metrics(writer: MetricsWriter, checker: PasswordExpiryChecker):
+    """Собирает счётчики сервисов для /metrics"""
+    handlers = bot.handler_stats()
+    writer.add("handler_queue_depth", handlers.get("queued", handlers.get("pending", 0)))
+    for status in ("completed", "failed"):
+        writer.add("handler_messages_total", handlers[status], {"status": status}, kind="counter")
+    for phase in ("wait", "run"):
+        writer.add(f"handler_{phase}_seconds_total", handlers[f"{phase}_total"], kind="counter")
+        writer.add(f"handler_{phase}_seconds_max", handlers[f"{phase}_max"])
+    if bot.last_poll_at is not None:
+        writer.add("bot_last_poll_age_seconds", time.monotonic() - bot.last_poll_at)
+    for lane, waiting in messenger_limiter.stats().items():
+        if lane.startswith("waiting_"):
+            writer.add("bot_send_waiting", waiting, {"lane": lane[len("waiting_"):]})
+
+    for pool, stats in ad.pool_stats().items():
+        labels = {"pool": pool}
+        writer.add("ldap_calls_total", stats["borrowed"], labels, kind="counter")
+        writer.add("ldap_call_seconds_total", stats["busy_seconds"], labels, kind="counter")
+        writer.add("ldap_connections_in_use", stats["in_use"], labels)
+        writer.add("ldap_connections_idle", stats["idle"], labels)
+        writer.add("ldap_connections_created_total", stats["created"], labels, kind="counter")
+        if stats["last_ok_age"] is not None:
+            writer.add("ldap_last_success_age_seconds", stats["last_ok_age"], labels)
+    writer.add("ad_store_users", len(ad.user_store))
+    if ad.user_store.ready:
+        writer.add("ad_store_age_seconds", ad.user_store.age())
+
+    pool = ya360.pool_stats()
+    writer.add("ya360_connections_limit", pool["limit"])
+    writer.add("ya360_connections_in_use", pool["acquired"])
+    writer.add("ya360_connections_idle", pool["idle"])
+    writer.add("ya360_connections_created_total", pool["created"], kind="counter")
+    writer.add("ya360_connections_reused_total", pool["reused"], kind="counter")
+    for endpoint, stats in ya360.quota_stats().items():
+        labels = {"endpoint": endpoint}
+        writer.add("ya360_requests_total", stats["requests"], labels, kind="counter")
+        writer.add("ya360_throttled_total", stats["throttled"], labels, kind="counter")
+        writer.add("ya360_request_seconds_total", stats["seconds"], labels, kind="counter")
+
+    for cache, stats in (("ad_admin", ad.admin_cache_stats()), ("sessions", sessions.stats())):
+        for result in ("hits", "stale_hits", "misses"):
+            if result in stats:
+                writer.add("cache_requests_total", stats[result], {"cache": cache, "result": result}, kind="counter")
+        writer.add("cache_evictions_total", stats["evictions"], {"cache": cache}, kind="counter")
+        writer.add("cache_size", stats["size"], {"cache": cache})
+
+    notifications = checker.stats()
+    writer.add("notification_queue_depth", notifications["queued"])
+    writer.add("notification_dead_letters", notifications["dead_letters"])
+    for status in ("sent", "retried", "dead"):
+        writer.add("notifications_total", notifications[status], {"status": status}, kind="counter")
+
+    for job, stats in scheduler.jobs().items():
+        labels = {"job": job}
+        writer.add("job_runs_total", stats["runs"], labels, kind="counter")
+        writer.add("job_failures_total", stats["failures"], labels, kind="counter")
+        writer.add("job_skipped_total", stats["skipped"], labels, kind="counter")
+        if stats["last_run"] is not None:
+            writer.add("job_last_run_timestamp_seconds", stats["last_run"], labels)
+
+def start_health_server(checker, main_thread):
+    """Запускает HTTP-сервер проверок Nomad и метрик"""
+    def ad_reachable():
+        age = ad.pool_stats()["read"]["last_ok_age"]
+        if age is not None and age < settings.HEALTH_AD_MAX_AGE:
+            return True
+        # Без обращений к AD отметка устаревает: проверяем сервер сами
+        return ad.ping()
+
+    def polling_recently():
+        return bot.last_poll_at is not None and time.monotonic() - bot.last_poll_at < settings.HEALTH_POLL_MAX_AGE
+
+    server = HealthServer(
+        settings.HEALTH_PORT,
+        liveness=main_thread.is_alive,
+        readiness={
+            "ad_pool": ad_reachable,
+            "ya360_directory": ya360.directory_loaded,
+            "bot_polling": polling_recently,
+        },
+        collectors=[lambda writer: collect_metrics(writer, checker)],
+    )
+    return server.start()
+
 def watchdog(main_thread):
     while True:
         if not main_thread.is_alive():
@@ -159,7 +252,10 @@ def watchdog(main_thread):
 
 def main():
     try:
-        bot.run()
+        if settings.BOT_RUNTIME == "asyncio":
+            AsyncBotRuntime(bot).run()
+        else:
+            bot.run()
     except requests.exceptions.ConnectionError as e:
         logging.error(f"Ошибка сети: {e}")
         time.sleep(10)  # Ждем перед повторной попыткой
@@ -175,10 +271,34 @@ if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO,
                         format='%(asctime)s – %(message)s',
                         datefmt=custom_time_format)
-    checker, notif_thread, sched_thread = run_password_checker(bot, ad, utils)
+    # Схема AD загружается один раз до начала обработки сообщений
+    ad.schema.load()
+    # Снимки с диска отвечают сразу после перезапуска и обновляются в фоне
+    ya360.restore_directory()
+    ad.restore_warm_cache()
+    # Состав отслеживаемых групп нужен с первого сообщения; устаревший снимок с диска
+    # для проверки прав не используется
+    if ad.group_index.age() > settings.AD_GROUP_INDEX_TTL:
+        ad.refresh_group_index()
+    # Локальная копия пользователей AD для отчётов и справок, обновляется в фоне
+    scheduler.add_interval_job("ad_user_sync", ad.sync_users, settings.AD_STORE_SYNC_INTERVAL)
+    # Состав групп обновляется заранее (дважды за время жизни снимка), чтобы проверка прав не ждала AD
+    scheduler.add_interval_job(
+        "ad_group_index", ad.refresh_group_index, settings.AD_GROUP_INDEX_TTL / 2,
+        jitter=settings.AD_GROUP_INDEX_TTL / 10
+    )
+    checker, notif_threads = run_password_checker(bot, ad, utils)
+    # Ежедневный аудит 2FA (UTC Time)
+    scheduler.add_daily_job(
+        "ya360_2fa_audit", template.send_2fa_audit_report, settings.YA360_2FA_AUDIT_AT,
+        jitter=settings.SCHEDULER_JITTER
+    )
+    scheduler.start()
     # run_test_check(checker)
     main_thread = threading.Thread(target=main)
     main_thread.start()
+    # /healthz, /readyz и /metrics для проверок Nomad и Prometheus
+    start_health_server(checker, main_thread)
     
     watchdog_thread = threading.Thread(target=watchdog, args=(main_thread,))
     watchdog_thread.daemon = True
@@ -0,0 +1,106 @@
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from ldap3 import ALL, NONE, Connection, Server
+from ldap3.protocol.rfc4512 import DsaInfo, SchemaInfo
+
+
+class ADSchemaCache:
+    """Shares one copy of the AD DSA info and schema between ldap3 Server objects.
+
+    The schema is read from the directory once (or from an on-disk snapshot)
+    and attached to servers created with get_info=NONE, so binds no longer
+    re-download it.
+    """
+
+    def __init__(self, host: str, user: str, password: str, snapshot_dir: str, snapshot_max_age: int):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_max_age = snapshot_max_age
+        self._info: Optional[DsaInfo] = None
+        self._schema: Optional[SchemaInfo] = None
+        self._lock = threading.Lock()
+
+    @property
+    def _info_path(self) -> str:
+        return os.path.join(self.snapshot_dir, "dsa_info.json")
+
+    @property
+    def _schema_path(self) -> str:
+        return os.path.join(self.snapshot_dir, "schema.json")
+
+    def _snapshot_age(self) -> Optional[float]:
+        try:
+            return time.time() - min(os.path.getmtime(self._info_path), os.path.getmtime(self._schema_path))
+        except OSError:
+            return None
+
+    def _load_snapshot(self) -> bool:
+        try:
+            self._info = DsaInfo.from_file(self._info_path)
+            self._schema = SchemaInfo.from_file(self._schema_path)
+            logging.info(f"Схема AD загружена из {self.snapshot_dir}")
+            return True
+        except Exception as e:
+            logging.error(f"Не удалось прочитать снимок схемы AD: {e}")
+            self._info, self._schema = None, None
+            return False
+
+    def _load_from_directory(self) -> bool:
+        try:
+            server = Server(self.host, get_info=ALL)
+            with Connection(server, user=self.user, password=self.password, auto_bind=True):
+                self._info, self._schema = server.info, server.schema
+        except Exception as e:
+            logging.error(f"Не удалось получить схему AD с {self.host}: {e}")
+            return False
+        if not self._info or not self._schema:
+            return False
+        logging.info(f"Схема AD получена с {self.host}")
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            self._info.to_file(self._info_path)
+            self._schema.to_file(self._schema_path)
+        except Exception as e:
+            logging.error(f"Не удалось сохранить снимок схемы AD: {e}")
+        return True
+
+    def load(self) -> bool:
+        """Loads schema and DSA info once. Returns False if neither source is available."""
+        if self._schema is not None:
+            return True
+        with self._lock:
+            if self._schema is not None:
+                return True
+            age = self._snapshot_age()
+            if age is not None and age < self.snapshot_max_age and self._load_snapshot():
+                return True
+            # Снимок устарел или отсутствует: берём схему с сервера, при неудаче - старый снимок
+            return self._load_from_directory() or (age is not None and self._load_snapshot())
+
+    def server(
+            self,
+            host: str = None,
+            use_ssl: bool = False,
+            typed: bool = True,
+            connect_timeout: Optional[int] = None
+        ) -> Server:
+        """Creates a Server sharing the cached schema.
+
+        typed=False gives a schema-less server whose attribute values stay raw strings.
+        """
+        host = host or self.host
+        if not typed:
+            return Server(host, use_ssl=use_ssl, get_info=NONE, connect_timeout=connect_timeout)
+        if not self.load():
+            # Без схемы значения атрибутов не типизируются, поэтому запрашиваем её как раньше
+            return Server(host, use_ssl=use_ssl, get_info=ALL, connect_timeout=connect_timeout)
+        server = Server(host, use_ssl=use_ssl, get_info=NONE, connect_timeout=connect_timeout)
+        server.attach_dsa_info(self._info)
+        server.attach_schema_info(self._schema)
+        return server
@@ -0,0 +1,109 @@
+from datetime import datetime
+from typing import Any, Dict, Iterator, List
+
+from ldap3 import Connection
+
+
+def _single(value: Any) -> Any:
+    # Без схемы ldap3 возвращает все значения списками
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+class ADUserRecord:
+    """Lightweight user record built from a raw search response entry."""
+
+    __slots__ = (
+        "username",
+        "display_name",
+        "distinguished_name",
+        "pwd_last_set",
+        "user_account_control",
+        "mail",
+        "birthday",
+        "when_created",
+        "telephone_number",
+        "member_of",
+        "object_guid",
+        "usn_changed",
+    )
+
+    ATTRIBUTES = {
+        "username": "sAMAccountName",
+        "display_name": "displayName",
+        "distinguished_name": "distinguishedName",
+        "pwd_last_set": "pwdLastSet",
+        "user_account_control": "userAccountControl",
+        "mail": "mail",
+        "birthday": "extensionAttribute1",
+        "when_created": "whenCreated",
+        "telephone_number": "telephoneNumber",
+        "member_of": "memberOf",
+        "object_guid": "objectGUID",
+        "usn_changed": "uSNChanged",
+    }
+    # Многозначные атрибуты хранятся списками
+    MULTI_VALUED = {"member_of"}
+    DATETIME_SLOTS = {"pwd_last_set", "when_created"}
+
+    def __init__(self, **values):
+        for slot in self.__slots__:
+            setattr(self, slot, values.get(slot))
+
+    @classmethod
+    def from_response(cls, entry: Dict) -> "ADUserRecord":
+        attributes = entry.get("attributes") or {}
+        record = cls.__new__(cls)
+        for slot, attribute in cls.ATTRIBUTES.items():
+            value = attributes.get(attribute)
+            if slot in cls.MULTI_VALUED:
+                setattr(record, slot, list(value or []))
+            else:
+                setattr(record, slot, _single(value))
+        if record.distinguished_name is None:
+            record.distinguished_name = entry.get("dn")
+        return record
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns a JSON-serialisable dict, datetimes as ISO strings."""
+        data = {}
+        for slot in self.__slots__:
+            value = getattr(self, slot, None)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            data[slot] = value
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ADUserRecord":
+        values = dict(data)
+        for slot in cls.DATETIME_SLOTS:
+            if values.get(slot):
+                values[slot] = datetime.fromisoformat(values[slot])
+        return cls(**values)
+
+    def __repr__(self) -> str:
+        return f"ADUserRecord({self.username!r})"
+
+
+def paged_search(
+        conn: Connection,
+        search_base: str,
+        search_filter: str,
+        attributes: List[str],
+        page_size: int = 1000
+    ) -> Iterator[ADUserRecord]:
+    """Yields records page by page without building ldap3 Entry objects.
+
+    Only the current page is kept in memory; the connection stays busy
+    until the generator is exhausted or closed.
+    """
+    for entry in conn.extend.standard.paged_search(
+            search_base,
+            search_filter,
+            attributes=attributes,
+            paged_size=page_size,
+            generator=True):
+        if entry.get("type") == "searchResEntry":
+            yield ADUserRecord.from_response(entry)
@@ -1,168 +1,563 @@
 import logging
+import threading
+import time
 import pytz
+import dns.resolver
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Optional, Tuple, Union
-from ldap3 import Server, Connection, ALL
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple, Union
+from ldap3 import BASE, Connection
+from ldap3.utils.conv import escape_filter_chars
 
 from config import settings
 
 from exceptions import AccessException
+from services.ad_schema import ADSchemaCache
+from services.ad_search import ADUserRecord, paged_search
+from services.ad_store import ADUserStore
+from services.cache import LRUCache, TTLCache
+from services.expiry_index import PasswordExpiryIndex
+from services.group_index import GroupMembershipIndex
+from services.ldap_pool import LDAPConnectionPool
+from services.warm_cache import WarmCache
+
+# Срок действия пароля по доменной политике
+PASSWORD_MAX_AGE = timedelta(days=90)
+# Начало отсчёта FILETIME (pwdLastSet, lastLogon) - интервалы по 100 нс
+FILETIME_EPOCH = datetime(1601, 1, 1, tzinfo=timezone.utc)
+# userAccountControl: учётная запись отключена (ACCOUNTDISABLE)
+UAC_ACCOUNT_DISABLED = 0x2
+LDAP_MATCHING_RULE_BIT_AND = "1.2.840.113556.1.4.803"
+# Членство с учётом вложенных групп
+LDAP_MATCHING_RULE_IN_CHAIN = "1.2.840.113556.1.4.1941"
+# Отметка «логин ещё не разрешался» в кэше логинов (None - учётка не найдена)
+_UNRESOLVED = object()
+# Объекты, которые реплицируются в локальное хранилище (тот же фильтр, что и у отчётов)
+USER_STORE_FILTER = "(objectClass=user)"
+
+
+def to_filetime(dt: datetime) -> int:
+    """Converts an aware datetime to an AD FILETIME integer."""
+    return (dt - FILETIME_EPOCH) // timedelta(microseconds=1) * 10
+
+@dataclass
+class ADUserProfile:
+    """User attributes fetched from AD in a single search."""
+
+    login: str
+    distinguished_name: str
+    pwd_last_set: Optional[datetime] = None
+    when_created: Optional[datetime] = None
+    telephone_number: Optional[str] = None
+    mail: Optional[str] = None
+    user_account_control: Optional[int] = None
+    member_of: List[str] = field(default_factory=list)
+
+    ATTRIBUTES = [
+        "sAMAccountName",
+        "distinguishedName",
+        "pwdLastSet",
+        "whenCreated",
+        "telephoneNumber",
+        "mail",
+        "userAccountControl",
+        "memberOf",
+    ]
+
+    @classmethod
+    def from_record(cls, record: ADUserRecord) -> "ADUserProfile":
+        return cls(
+            login=record.username,
+            distinguished_name=record.distinguished_name,
+            pwd_last_set=record.pwd_last_set,
+            when_created=record.when_created,
+            telephone_number=record.telephone_number,
+            mail=record.mail,
+            user_account_control=record.user_account_control,
+            member_of=list(record.member_of or []),
+        )
+
 
 class ADConnector:
     """Class for handling Active Directory operations."""
 
-    def __init__(self, ya360, utils):
+    def __init__(self, ya360, utils, warm_cache: Optional[WarmCache] = None):
         self.ya360 = ya360
         self.utils = utils
-        self.server = Server(settings.AD_SERVER, get_info=ALL)
+        # Снимки пользователей и групп на диске для быстрого старта после перезапуска
+        self.warm_cache = warm_cache
+        # Схема и сведения о DSA читаются один раз и общие для всех объектов Server
+        self.schema = ADSchemaCache(
+            settings.AD_SERVER,
+            settings.AD_USER,
+            settings.AD_PASSWORD,
+            settings.AD_SCHEMA_CACHE_DIR,
+            settings.AD_SCHEMA_SNAPSHOT_MAX_AGE,
+        )
         self.base_dn = settings.AD_BASE_DN
-        self._dc_addresses = [
-            'dc01.test.local',
-            'dc02.test.local',
-        ]
-        # Кэш для хранения результатов проверки админских прав
-        self._admin_cache: Dict[str, Tuple[bool, datetime]] = {}
-        # Время жизни кэша (в часах)
-        self._admin_cache_ttl = 1
-
-    def _get_connection(self, use_ssl: bool = False, for_password_change: bool = False) -> Connection:
-        """Creates and returns a new AD connection."""
-        if for_password_change:
-            user = settings.AD_USER_FOR_PASS_CHANGE
-            password = settings.AD_PASSWORD_FOR_PASS_CHANGE
-            server = Server(settings.AD_SERVER, get_info=ALL, use_ssl=True)
-        else:
-            user = settings.AD_USER
-            password = settings.AD_PASSWORD
-            server = self.server if not use_ssl else Server(settings.AD_SERVER, get_info=ALL, use_ssl=True)
-        logging.debug(f'Обращение к {server}')
-        return Connection(server, user=user, password=password, auto_bind=True)
+        # Контроллеры домена для чтения lastLogon (не реплицируется между DC)
+        self._dc_addresses: Optional[List[str]] = None
+        self._dc_discovered_at = 0.0
+        self._dc_pools: Dict[str, LDAPConnectionPool] = {}
+        self._dc_lock = threading.Lock()
+        self._dc_executor = ThreadPoolExecutor(
+            max_workers=settings.AD_DC_MAX_WORKERS,
+            thread_name_prefix="dc_last_logon"
+        )
+        # Состав групп, которые проверяет бот, обновляется в фоне раз в AD_GROUP_INDEX_TTL
+        self.group_index = GroupMembershipIndex([
+            settings.AD_ADMIN_GROUP_DN,
+            settings.AD_SUPPORT_GROUP_DN,
+        ])
+        self._group_index_lock = threading.Lock()
+        self._group_index_refreshing = False
+        # Локальная копия пользователей AD, синхронизируется по uSNChanged
+        self.user_store = ADUserStore()
+        # Даты истечения паролей по дням, обновляется вместе с локальной копией
+        self.expiry_index = PasswordExpiryIndex(PASSWORD_MAX_AGE, UAC_ACCOUNT_DISABLED)
+        # Логин мессенджера -> sAMAccountName; промахи кэшируются на AD_LOGIN_NEGATIVE_TTL
+        self._login_cache = TTLCache(settings.AD_LOGIN_CACHE_TTL)
+        # Кэш результатов проверки админских прав, сбрасывается при изменении состава групп
+        self._admin_cache = LRUCache(
+            settings.AD_ADMIN_CACHE_SIZE,
+            settings.AD_ADMIN_CACHE_TTL,
+            settings.AD_ADMIN_CACHE_STALE_TTL,
+            name="admin"
+        )
+        self.group_index.on_change(self._admin_cache.clear)
+        # Пулы заранее привязанных соединений: для чтения и для смены паролей
+        self._read_pool = LDAPConnectionPool(
+            "read",
+            lambda: self.schema.server(),
+            settings.AD_USER,
+            settings.AD_PASSWORD,
+            size=settings.AD_POOL_SIZE,
+            max_idle=settings.AD_POOL_MAX_IDLE,
+            health_check_interval=settings.AD_POOL_HEALTH_CHECK_INTERVAL,
+            acquire_timeout=settings.AD_POOL_ACQUIRE_TIMEOUT,
+            receive_timeout=settings.AD_RECEIVE_TIMEOUT,
+        )
+        self._password_pool = LDAPConnectionPool(
+            "password",
+            lambda: self.schema.server(use_ssl=True),
+            settings.AD_USER_FOR_PASS_CHANGE,
+            settings.AD_PASSWORD_FOR_PASS_CHANGE,
+            size=settings.AD_PASSWORD_POOL_SIZE,
+            max_idle=settings.AD_POOL_MAX_IDLE,
+            health_check_interval=settings.AD_POOL_HEALTH_CHECK_INTERVAL,
+            acquire_timeout=settings.AD_POOL_ACQUIRE_TIMEOUT,
+            receive_timeout=settings.AD_RECEIVE_TIMEOUT,
+            on_connect=lambda conn: conn.start_tls(),
+        )
+
+    @contextmanager
+    def _get_connection(self, for_password_change: bool = False) -> Iterator[Connection]:
+        """Borrows a bound AD connection from the pool."""
+        pool = self._password_pool if for_password_change else self._read_pool
+        with pool.connection() as conn:
+            logging.debug(f'Обращение к {conn.server}')
+            yield conn
+
+    def ping(self) -> bool:
+        """Checks that AD answers on a read pool connection."""
+        return self._read_pool.ping()
+
+    def pool_stats(self) -> Dict[str, Dict[str, int]]:
+        """Returns LDAP connection pool statistics."""
+        return {
+            "read": self._read_pool.stats(),
+            "password": self._password_pool.stats(),
+        }
+
+    def _read_sync_watermark(self, conn: Connection) -> Tuple[int, str]:
+        """Reads highestCommittedUSN and dsServiceName of the DC behind the connection."""
+        conn.search(
+            "",
+            "(objectClass=*)",
+            search_scope=BASE,
+            attributes=["highestCommittedUSN", "dsServiceName"]
+        )
+        attributes = conn.response[0]["attributes"]
+
+        def single(name: str):
+            value = attributes.get(name)
+            return value[0] if isinstance(value, list) else value
+
+        return int(single("highestCommittedUSN")), str(single("dsServiceName"))
+
+    def sync_users(self) -> bool:
+        """Synchronises the user store with AD.
+
+        The first run and every AD_STORE_FULL_SYNC_INTERVAL seconds load all
+        users (this also drops deleted ones); other runs fetch only objects
+        whose uSNChanged is above the stored watermark.
+        """
+        store = self.user_store
+        full = not store.ready or store.full_age() > settings.AD_STORE_FULL_SYNC_INTERVAL
+        started = time.monotonic()
+        try:
+            with self._get_connection() as conn:
+                highest_usn, dc = self._read_sync_watermark(conn)
+                if not full and (dc != store.dc or highest_usn < store.highest_usn):
+                    # USN локален для контроллера: другой DC или восстановление из копии
+                    logging.info(f"Сменился контроллер домена или его USN ({dc}), полная синхронизация")
+                    full = True
+                search_filter = USER_STORE_FILTER
+                if not full:
+                    search_filter = f"(&{USER_STORE_FILTER}(uSNChanged>={store.highest_usn + 1}))"
+                records = list(paged_search(
+                    conn,
+                    self.base_dn,
+                    search_filter,
+                    list(ADUserRecord.ATTRIBUTES.values()),
+                    page_size=settings.AD_STORE_PAGE_SIZE
+                ))
+        except Exception as e:
+            logging.error(f"Не удалось синхронизировать пользователей AD: {e}")
+            return False
 
-    def _is_cache_valid(self, cache_time: datetime) -> bool:
-        """Проверяет, не истек ли срок действия кэша."""
-        return datetime.now() - cache_time < timedelta(hours=self._admin_cache_ttl)
+        if full:
+            store.replace(records, highest_usn, dc)
+            self.expiry_index.rebuild(records)
+            logging.info(
+                f"Пользователи AD загружены полностью: {len(records)} за {time.monotonic() - started:.1f} с"
+            )
+        else:
+            store.apply(records, highest_usn, dc)
+            self.expiry_index.update(records)
+            logging.debug(f"Синхронизация AD: изменено {len(records)} пользователей, USN {highest_usn}")
+        if self.warm_cache and (full or records):
+            self.warm_cache.save_ad_users(
+                ((store.key(record), record.to_dict()) for record in records),
+                store.export_meta(),
+                full=full
+            )
+        return True
+
+    def restore_warm_cache(self) -> bool:
+        """Loads user and group snapshots saved before the last restart.
+
+        Restored data keeps its real age, so the regular sync and TTL refresh
+        revalidate it in the background.
+        """
+        if not self.warm_cache:
+            return False
+        restored = False
+        groups = self.warm_cache.load("ad_groups")
+        if groups is not None:
+            members, age = groups
+            self.group_index.restore(members, age)
+            logging.info(f"Состав групп AD восстановлен с диска (возраст {int(age)} с)")
+            restored = True
+        users = self.warm_cache.load_ad_users()
+        if users is not None:
+            rows, meta, age = users
+            try:
+                self.user_store.restore((ADUserRecord.from_dict(row) for row in rows), meta, age)
+                self.expiry_index.rebuild(self.user_store.records())
+            except Exception as e:
+                logging.error(f"Не удалось восстановить пользователей AD с диска: {e}")
+            else:
+                logging.info(f"Пользователи AD восстановлены с диска: {len(rows)} (возраст {int(age)} с)")
+                restored = True
+        return restored
+
+    def _usable_store(self) -> Optional[ADUserStore]:
+        """Returns the user store if it is fresh enough to answer instead of AD."""
+        if self.user_store.ready and self.user_store.age() <= settings.AD_STORE_MAX_AGE:
+            return self.user_store
+        return None
+
+    def _store_lookup(self, login: str) -> Optional[ADUserRecord]:
+        store = self._usable_store()
+        return store.get(login) if store else None
+
+    def _find_account(self, login: str) -> Optional[str]:
+        """Returns the sAMAccountName matching login from the store or AD."""
+        record = self._store_lookup(login)
+        if record is not None:
+            return record.username
+        # В хранилище может ещё не быть только что созданной учётки
+        with self._get_connection() as conn:
+            conn.search(
+                self.base_dn,
+                f"(sAMAccountName={escape_filter_chars(login)})",
+                attributes=["sAMAccountName"]
+            )
+            for entry in conn.response:
+                if entry.get("type") == "searchResEntry":
+                    return ADUserRecord.from_response(entry).username
+        return None
+
+    def resolve_login(self, login: str) -> Optional[str]:
+        """Maps a messenger login to its AD sAMAccountName, trying the Yandex 360 alias as well.
+
+        Both found and missing accounts are cached; None means no AD account.
+        """
+        key = login.split("@")[0].lower()
+        account = self._login_cache.get(key, _UNRESOLVED)
+        if account is not _UNRESOLVED:
+            return account
+
+        account = self._find_account(key)
+        if account is None:
+            alias = self.ya360.get_user_alias(key)
+            if alias and alias.lower() != key:
+                logging.debug(f"Логин {key} не найден в AD, пробуем алиас {alias}")
+                account = self._find_account(alias.split("@")[0])
+
+        if account is None:
+            logging.debug(f"Учётная запись AD для {key} не найдена")
+            self._login_cache.set(key, None, ttl=settings.AD_LOGIN_NEGATIVE_TTL)
+        else:
+            self._login_cache.set(key, account)
+        return account
+
+    def _fetch_record(self, account: str, attributes: List[str]) -> Optional[ADUserRecord]:
+        """Returns the account's record from the store, or reads the given attributes from AD."""
+        record = self._store_lookup(account)
+        if record is not None:
+            return record
+        with self._get_connection() as conn:
+            conn.search(
+                self.base_dn,
+                f"(sAMAccountName={escape_filter_chars(account)})",
+                attributes=attributes
+            )
+            for entry in conn.response:
+                if entry.get("type") == "searchResEntry":
+                    return ADUserRecord.from_response(entry)
+        return None
+
+    def _search_accounts(self, conn: Connection, accounts: List[str], attributes: List[str]) -> Dict[str, ADUserRecord]:
+        """Fetches accounts with OR-filter searches of at most AD_BATCH_SIZE terms each."""
+        found = {}
+        for start in range(0, len(accounts), settings.AD_BATCH_SIZE):
+            chunk = accounts[start:start + settings.AD_BATCH_SIZE]
+            terms = "".join(f"(sAMAccountName={escape_filter_chars(account)})" for account in chunk)
+            for record in paged_search(conn, self.base_dn, f"(&(objectClass=user)(|{terms}))", attributes):
+                if record.username:
+                    found[record.username.lower()] = record
+        return found
+
+    def get_users(self, logins: Iterable[str], attributes: List[str] = None) -> Dict[str, ADUserRecord]:
+        """Fetches several users at once. Returns records keyed by the given logins; unknown logins are omitted.
+
+        Records come from the local store when it is fresh; the rest are read
+        with batched OR-filter searches over one connection. Logins missing in
+        AD are searched once more by their Yandex 360 alias. Results feed the
+        login cache shared with resolve_login.
+        """
+        attributes = list(attributes or ADUserRecord.ATTRIBUTES.values())
+        if "sAMAccountName" not in attributes:
+            attributes.append("sAMAccountName")
+        result: Dict[str, ADUserRecord] = {}
+        pending: Dict[str, List[str]] = {}
+        for login in dict.fromkeys(logins):
+            key = login.split("@")[0].lower()
+            account = self._login_cache.get(key, _UNRESOLVED)
+            if account is None:
+                continue
+            account = key if account is _UNRESOLVED else account.lower()
+            record = self._store_lookup(account)
+            if record is not None:
+                result[login] = record
+            else:
+                pending.setdefault(account, []).append(login)
+        if not pending:
+            return result
+
+        aliases: Dict[str, str] = {}
+        with self._get_connection() as conn:
+            logging.debug(f"Пакетный поиск {len(pending)} пользователей в AD")
+            found = self._search_accounts(conn, list(pending), attributes)
+            # Не нашли по логину: пробуем алиас из Yandex 360 в том же соединении
+            for account in pending:
+                if account not in found:
+                    alias = self.ya360.get_user_alias(account)
+                    if alias and alias.split("@")[0].lower() != account:
+                        aliases[account] = alias.split("@")[0].lower()
+            if aliases:
+                by_alias = self._search_accounts(conn, list(dict.fromkeys(aliases.values())), attributes)
+                for account, alias in aliases.items():
+                    if alias in by_alias:
+                        found[account] = by_alias[alias]
+
+        for account, account_logins in pending.items():
+            record = found.get(account)
+            for login in account_logins:
+                key = login.split("@")[0].lower()
+                if record is None:
+                    self._login_cache.set(key, None, ttl=settings.AD_LOGIN_NEGATIVE_TTL)
+                    continue
+                self._login_cache.set(key, record.username)
+                result[login] = record
+        return result
+
+    def data_freshness(self) -> str:
+        """Describes where AD data in replies comes from, for admin messages."""
+        store = self._usable_store()
+        if store is None:
+            return "Данные AD получены напрямую с контроллера домена"
+        return (
+            f"Данные AD на {self.utils.format_utc_to_moscow(store.synced_at)}(MSK), "
+            f"обновлены {int(store.age())} с назад"
+        )
+
+    def admin_cache_stats(self) -> Dict[str, int]:
+        """Returns admin check cache statistics."""
+        return self._admin_cache.stats()
 
     def _get_admin_group_dn(self) -> str:
         """Возвращает DN группы администраторов."""
-        return "CN=IT,OU=Security Groups,OU=MyBusiness,DC=test,DC=local"
+        return settings.AD_ADMIN_GROUP_DN
 
     def get_password_expiry_date(self, login: str) -> str:
         """Returns the password expiry date for a user."""
         try:
-            with self._get_connection() as conn:
-                conn.search(
-                    self.base_dn,
-                    f"(sAMAccountName={login})",
-                    attributes=["pwdLastSet"]
-                )
-                logging.debug(f'Получение даты последней смены пароля {login}')
-                if conn.entries:
-                    pwd_last_set = conn.entries[0].pwdLastSet.value
-                    if isinstance(pwd_last_set, datetime):
-                        pwd_last_set = pwd_last_set.replace(tzinfo=None)
-                        return pwd_last_set.strftime("%d.%m.%Y %H:%M")
-                    return "Ошибка: атрибут pwdLastSet не является объектом datetime."
-                
-                alias = self.ya360.get_user_alias(login)
-                if alias:
-                    return self.get_password_expiry_date(alias)
+            account = self.resolve_login(login)
+            logging.debug(f'Получение даты последней смены пароля {login}')
+            record = self._fetch_record(account, ["pwdLastSet"]) if account else None
+            if record is None:
                 return f"Пользователь {login} не найден или у него отсутствует атрибут pwdLastSet."
+            if isinstance(record.pwd_last_set, datetime):
+                return record.pwd_last_set.replace(tzinfo=None).strftime("%d.%m.%Y %H:%M")
+            return "Ошибка: атрибут pwdLastSet не является объектом datetime."
         except Exception as e:
             return f"Ошибка подключения к AD: {e}"
 
     def get_account_creation_date(self, login: str) -> Union[datetime, str]:
         """Gets the account creation date from Active Directory."""
         try:
-            with self._get_connection() as conn:
-                logging.debug(f'Получение даты создания аккаунта {login}')
-                conn.search(
-                    self.base_dn,
-                    f"(sAMAccountName={login})",
-                    attributes=["whenCreated"]
-                )
-                if conn.entries:
-                    when_created = conn.entries[0].whenCreated.value
-                    if isinstance(when_created, datetime):
-                        return when_created
-                    return "Ошибка: атрибут when_created не является объектом datetime."
-
-                alias = self.ya360.get_user_alias(login)
-                if alias:
-                    return self.get_account_creation_date(alias)
+            account = self.resolve_login(login)
+            logging.debug(f'Получение даты создания аккаунта {login}')
+            record = self._fetch_record(account, ["whenCreated"]) if account else None
+            if record is None:
                 return f"Пользователь {login} не найден."
+            if isinstance(record.when_created, datetime):
+                return record.when_created
+            return "Ошибка: атрибут when_created не является объектом datetime."
         except Exception as e:
             return f"Ошибка подключения к AD: {e}"
 
+    def _discover_dc_addresses(self) -> List[str]:
+        """Returns DC hosts from AD_DC_ADDRESSES, DNS SRV records or AD_SERVER, in that order."""
+        if settings.AD_DC_ADDRESSES:
+            return [dc.strip() for dc in settings.AD_DC_ADDRESSES.split(",") if dc.strip()]
+
+        domain = settings.AD_DOMAIN or ".".join(
+            part.split("=", 1)[1]
+            for part in self.base_dn.split(",")
+            if part.strip().upper().startswith("DC=")
+        )
+        try:
+            answers = dns.resolver.resolve(f"_ldap._tcp.dc._msdcs.{domain}", "SRV", lifetime=5)
+            dcs = sorted({str(answer.target).rstrip(".") for answer in answers})
+            if dcs:
+                logging.info(f"Найдены контроллеры домена {domain}: {', '.join(dcs)}")
+                return dcs
+        except Exception as e:
+            logging.error(f"Не удалось получить SRV-записи контроллеров домена {domain}: {e}")
+        return [settings.AD_SERVER]
+
+    def _get_dc_addresses(self) -> List[str]:
+        with self._dc_lock:
+            if (self._dc_addresses is None
+                    or time.monotonic() - self._dc_discovered_at > settings.AD_DC_DISCOVERY_TTL):
+                self._dc_addresses = self._discover_dc_addresses()
+                self._dc_discovered_at = time.monotonic()
+            return self._dc_addresses
+
+    def _get_dc_pool(self, dc: str) -> LDAPConnectionPool:
+        with self._dc_lock:
+            if dc not in self._dc_pools:
+                self._dc_pools[dc] = LDAPConnectionPool(
+                    dc,
+                    # lastLogon разбирается вручную, типизация по схеме здесь не нужна
+                    lambda: self.schema.server(dc, typed=False, connect_timeout=settings.AD_DC_TIMEOUT),
+                    settings.AD_USER,
+                    settings.AD_PASSWORD,
+                    size=settings.AD_DC_POOL_SIZE,
+                    max_idle=settings.AD_POOL_MAX_IDLE,
+                    health_check_interval=settings.AD_POOL_HEALTH_CHECK_INTERVAL,
+                    acquire_timeout=settings.AD_DC_TIMEOUT,
+                    receive_timeout=settings.AD_DC_TIMEOUT,
+                )
+            return self._dc_pools[dc]
+
+    def _get_last_logon_from_dc(self, dc: str, login: str) -> Optional[datetime]:
+        """Reads lastLogon from one DC. Returns None if the user is not found there."""
+        with self._get_dc_pool(dc).connection() as conn:
+            conn.search(
+                self.base_dn,
+                f"(sAMAccountName={escape_filter_chars(login)})",
+                attributes=["lastLogon"]
+            )
+            if not conn.entries:
+                return None
+            last_logon_raw = conn.entries[0].lastLogon.value
+
+        min_date = datetime(1601, 1, 1, tzinfo=timezone.utc)
+        if last_logon_raw is None:
+            last_logon_date = min_date  # Устанавливаем минимальную дату
+        elif isinstance(last_logon_raw, datetime):
+            last_logon_date = last_logon_raw  # Если это уже datetime, используем его напрямую
+        else:
+            try:
+                # Преобразуем значение в datetime с указанием часового пояса UTC
+                last_logon_date = min_date + timedelta(microseconds=int(last_logon_raw) / 10)
+            except (ValueError, TypeError):
+                # Если преобразование невозможно, устанавливаем минимальную дату
+                last_logon_date = min_date
+        logging.debug(f'Последний вход {login} на {dc} {last_logon_date}')
+        return last_logon_date
+
     def get_last_logon(self, login: str) -> Optional[datetime]:
-        """Gets the maximum lastLogon value for a user across all DCs."""
-        max_last_logon = None
+        """Gets the maximum lastLogon value for a user across all DCs.
+
+        DCs are queried concurrently; those that do not answer within AD_DC_TIMEOUT are skipped.
+        """
         logging.debug(f'Получение даты последнего входа {login}')
-        for dc in self._dc_addresses:
-            try:
-                server = Server(dc, get_info=ALL)
-                with Connection(
-                    server,
-                    user=settings.AD_USER,
-                    password=settings.AD_PASSWORD,
-                    auto_bind=True
-                ) as conn:
-                    conn.search(
-                        self.base_dn,
-                        f"(sAMAccountName={login})",
-                        attributes=["lastLogon"]
-                    )
-                    
-                    if conn.entries:
-                        try:
-                            last_logon_raw = conn.entries[0].lastLogon.value
-                            min_date = datetime(1601, 1, 1, tzinfo=timezone.utc)
-
-                            if last_logon_raw is None:
-                                last_logon_date = min_date  # Устанавливаем минимальную дату
-                            elif isinstance(last_logon_raw, datetime):
-                                last_logon_date = last_logon_raw  # Если это уже datetime, используем его напрямую
-                            else:
-                                try:
-                                    # Преобразуем значение в datetime с указанием часового пояса UTC
-                                    last_logon_date = min_date + timedelta(microseconds=int(last_logon_raw) / 10)
-                                except (ValueError, TypeError):
-                                    # Если преобразование невозможно, устанавливаем минимальную дату
-                                    last_logon_date = min_date
-                            logging.debug(f'Последний вход {login} на {dc} {last_logon_date}')
-                            if not max_last_logon or last_logon_date > max_last_logon:
-                                max_last_logon = last_logon_date
-                        except Exception as e:
-                            logging.error(f"Ошибка при получении даты последнего входа {login} на {dc}: {e}")
+        futures = {
+            self._dc_executor.submit(self._get_last_logon_from_dc, dc, login): dc
+            for dc in self._get_dc_addresses()
+        }
+        done, not_done = wait(futures, timeout=settings.AD_DC_TIMEOUT)
+        for future in not_done:
+            logging.error(f"Контроллер домена {futures[future]} не ответил за {settings.AD_DC_TIMEOUT} с")
 
+        max_last_logon = None
+        for future in done:
+            try:
+                last_logon_date = future.result()
             except Exception as e:
-                logging.error(f"Ошибка при подключении к контроллеру домена {dc}: {e}")
-        
+                logging.error(f"Ошибка при получении даты последнего входа {login} на {futures[future]}: {e}")
+                continue
+            if last_logon_date and (not max_last_logon or last_logon_date > max_last_logon):
+                max_last_logon = last_logon_date
+
         return max_last_logon
 
+    def get_user_profile(self, login: str) -> Optional[ADUserProfile]:
+        """Returns the user's profile from a single search, None if the user is not found."""
+        account = self.resolve_login(login)
+        if account is None:
+            return None
+        logging.debug(f'Получение профиля {account}')
+        record = self._fetch_record(account, ADUserProfile.ATTRIBUTES)
+        return ADUserProfile.from_record(record) if record else None
+
     def get_phone_number(self, login: str) -> str:
         """Gets user's phone number from AD."""
         try:
-            with self._get_connection() as conn:
-                logging.debug(f'Получение номера телефона {login}')
-                conn.search(
-                    self.base_dn,
-                    f"(sAMAccountName={login})",
-                    attributes=["telephoneNumber"]
-                )
-                
-                if conn.entries:
-                    phone = conn.entries[0].telephoneNumber.value
-                    return self.utils.normalize_phone_number(phone)
-                
-                alias = self.ya360.get_user_alias(login)
-                if alias:
-                    try:
-                        return self.get_phone_number(alias)
-                    except Exception:
-                        raise TypeError
+            account = self.resolve_login(login)
+            logging.debug(f'Получение номера телефона {login}')
+            record = self._fetch_record(account, ["telephoneNumber"]) if account else None
+            if record is None or not record.telephone_number:
                 return f"Пользователь с логином {login} не найден или не имеет телефонного номера."
-        except TypeError:
-            return f"Ошибка при поиске телефона в AD: {e}"
+            return self.utils.normalize_phone_number(record.telephone_number)
         except Exception as e:
             return f"Ошибка подключения к AD: {e}"
 
@@ -171,103 +566,266 @@ class ADConnector:
         logging.debug(f"Проверка соединения с AD сервером: {settings.AD_SERVER}")
         try:
             with self._get_connection() as conn:
-                return bool(conn.bind())
+                return bool(conn.bound)
         except Exception as e:
             logging.error(f"Ошибка при подключении к AD: {e}")
             return False
 
-    def user_in_group(self, login: str, groupname: str) -> bool:
-        """Checks if a user is in a specific group."""
+    @staticmethod
+    def _in_chain_filter(group_dn: str) -> str:
+        return f"(memberOf:{LDAP_MATCHING_RULE_IN_CHAIN}:={escape_filter_chars(group_dn)})"
+
+    def refresh_group_index(self) -> bool:
+        """Reloads transitive members of the tracked groups. Keeps the previous snapshot on failure."""
+        started = time.monotonic()
+        members = {}
         try:
             with self._get_connection() as conn:
-                if conn.search(
-                    self.base_dn,
-                    f"(sAMAccountName={login})",
-                    attributes=["distinguishedName"]
-                ):
-                    logging.debug(f"Проверка групп в которых состоит {login}")
-                    user_dn = conn.entries[0].distinguishedName.value
-                    if conn.search(user_dn, "(objectClass=*)", attributes=["memberOf"]):
-                        groups = (
-                            conn.entries[0].memberOf.values
-                            if hasattr(conn.entries[0], "memberOf")
-                            else []
+                for group_dn in self.group_index.groups:
+                    members[group_dn] = [
+                        record.username
+                        for record in paged_search(
+                            conn,
+                            self.base_dn,
+                            f"(&(objectClass=user){self._in_chain_filter(group_dn)})",
+                            ["sAMAccountName"]
                         )
-                        return groupname in groups
-                
-                logging.debug(f"Пользователь {login} не найден в базе AD")
-                return False
+                        if record.username
+                    ]
         except Exception as e:
-            logging.error(f"Ошибка при проверке пользователя в группе: {e}")
+            logging.error(f"Не удалось обновить состав групп AD, используется предыдущий снимок: {e}")
             return False
+        changed = self.group_index.update(members)
+        if self.warm_cache and changed:
+            self.warm_cache.save("ad_groups", self.group_index.export())
+        logging.info(
+            f"Состав групп AD обновлён за {time.monotonic() - started:.1f} с"
+            f"{'' if changed else ' (без изменений)'}: "
+            + ", ".join(f"{group_dn} - {len(logins)}" for group_dn, logins in members.items())
+        )
+        return True
+
+    def _refresh_group_index_background(self):
+        try:
+            self.refresh_group_index()
+        finally:
+            self._group_index_refreshing = False
+
+    def _get_group_index(self) -> GroupMembershipIndex:
+        """Returns the group index, refreshing it in the background once the TTL expires.
+
+        Callers must not trust a snapshot older than AD_GROUP_INDEX_TTL.
+        """
+        if self.group_index.loaded_at is None:
+            with self._group_index_lock:
+                if self.group_index.loaded_at is None:
+                    self.refresh_group_index()
+        elif self.group_index.age() > settings.AD_GROUP_INDEX_TTL:
+            with self._group_index_lock:
+                if not self._group_index_refreshing:
+                    self._group_index_refreshing = True
+                    threading.Thread(
+                        target=self._refresh_group_index_background,
+                        name="ad_group_index_refresh",
+                        daemon=True
+                    ).start()
+        return self.group_index
 
-    def get_users_with_expiring_passwords(self, days: int = 7) -> List[Dict]:
-        """Gets users whose passwords will expire in the specified number of days."""
+    def user_in_group(self, login: str, groupname: str) -> bool:
+        """Checks if a user is in a specific group, including membership through nested groups."""
+        try:
+            login = self.resolve_login(login) or login
+        except Exception as e:
+            logging.error(f"Не удалось определить учётную запись AD для {login}: {e}")
+
+        index = self._get_group_index()
+        if index.tracks(groupname) and index.age() <= settings.AD_GROUP_INDEX_TTL:
+            return index.is_member(login, groupname)
+
+        # Группа не отслеживается, снимок не загружен или устарел (например, восстановлен
+        # с диска, а AD недоступен): по старому снимку права не выдаём, один запрос к AD
         try:
             with self._get_connection() as conn:
-                now = datetime.now(pytz.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-                expiration_cutoff_date = now + timedelta(days=days)
+                logging.debug(f"Проверка членства {login} в группе {groupname}")
+                return bool(conn.search(
+                    self.base_dn,
+                    f"(&(sAMAccountName={escape_filter_chars(login)}){self._in_chain_filter(groupname)})",
+                    attributes=["sAMAccountName"]
+                ))
+        except Exception as e:
+            logging.error(f"Ошибка при проверке пользователя в группе: {e}")
+            return False
 
-                conn.search(
-                    search_base=self.base_dn,
-                    search_filter="(&(objectClass=user)(pwdLastSet=*))",
-                    attributes=["sAMAccountName", "pwdLastSet", "displayName"],
-                    paged_size=1000
-                )
+    @staticmethod
+    def _is_disabled(record: ADUserRecord) -> bool:
+        return bool((record.user_account_control or 0) & UAC_ACCOUNT_DISABLED)
 
-                expiring_users = []
-                logging.debug(f"Поиск пользователей с паролем истекающим в близжайшие {days} дней")
-                for entry in conn.entries:
-                    pwd_last_set = entry.pwdLastSet.value
-                    password_expiry_date = (pwd_last_set + timedelta(days=90)).replace(hour=0, minute=0, second=0, microsecond=0)
-                    if now <= password_expiry_date <= expiration_cutoff_date:
-                        expiring_users.append({
-                            "username": entry.sAMAccountName,
-                            "display_name": entry.displayName,
-                            "password_expiry_date": password_expiry_date.strftime("%d.%m.%Y")
-                        })
+    def _stored_password_records(self, store: ADUserStore) -> List[ADUserRecord]:
+        return [
+            record for record in store.records()
+            if isinstance(record.pwd_last_set, datetime) and not self._is_disabled(record)
+        ]
 
-                return expiring_users
+    @staticmethod
+    def _collect_expiring(records: Iterable[ADUserRecord], now: datetime, cutoff: datetime) -> List[Dict]:
+        expiring_users = []
+        for record in records:
+            password_expiry_date = (record.pwd_last_set + PASSWORD_MAX_AGE).replace(hour=0, minute=0, second=0, microsecond=0)
+            if now <= password_expiry_date <= cutoff:
+                expiring_users.append({
+                    "username": record.username,
+                    "display_name": record.display_name,
+                    "password_expiry_date": password_expiry_date.strftime("%d.%m.%Y")
+                })
+        return expiring_users
+
+    @staticmethod
+    def _collect_expired(records: Iterable[ADUserRecord], now: datetime) -> List[Dict]:
+        expired_users = []
+        for record in records:
+            password_expiry_date = record.pwd_last_set + PASSWORD_MAX_AGE
+            if now > password_expiry_date:
+                expired_users.append({
+                    "username": record.username,
+                    "display_name": record.display_name,
+                    "distinguished_name": record.distinguished_name,
+                    "password_expiry_date": password_expiry_date.strftime("%d.%m.%Y"),
+                    "userAccountControl": record.user_account_control
+                })
+        return expired_users
+
+    def _collect_birthdays(self, records: Iterable[ADUserRecord], days: int) -> List[Dict]:
+        yandex_users = self.ya360.get_yandex_users()
+        today = datetime.now()
+        future_date = today + timedelta(days=days)
+        upcoming_birthdays = []
+
+        for record in records:
+            birthday_str = record.birthday
+            try:
+                birthday = datetime.strptime(birthday_str, "%d.%m.%Y")
+                birthday_this_year = birthday.replace(year=today.year)
+
+                if birthday_this_year < today:
+                    birthday_this_year = birthday_this_year.replace(year=today.year + 1)
+
+                user_id = yandex_users.get((record.mail or "").lower())
+
+                if today <= birthday_this_year <= future_date:
+                    upcoming_birthdays.append({
+                        "username": record.username,
+                        "display_name": record.display_name,
+                        "email": record.mail,
+                        "user_id": user_id,
+                        "birthday": birthday_this_year.strftime("%d.%m.%Y")
+                    })
+
+            except ValueError:
+                logging.debug(
+                    f"Неверный формат даты для пользователя {record.username}: {birthday_str}"
+                )
+
+        return upcoming_birthdays
 
+    def get_users_with_expiring_passwords(self, days: int = 7) -> List[Dict]:
+        """Gets users whose passwords will expire in the specified number of days."""
+        try:
+            return self._find_expiring_passwords(days)
         except Exception as e:
             logging.error(f"Ошибка при поиске пользователей: {e}")
             return []
 
+    def _find_expiring_passwords(self, days: int) -> List[Dict]:
+        """Same as get_users_with_expiring_passwords, but AD errors are raised."""
+        now = datetime.now(pytz.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        expiration_cutoff_date = now + timedelta(days=days)
+        logging.debug(f"Поиск пользователей с паролем истекающим в близжайшие {days} дней")
+
+        if self._usable_store() is not None:
+            return self._collect_expiring(
+                self.expiry_index.expiring_between(now.date(), expiration_cutoff_date.date()),
+                now,
+                expiration_cutoff_date
+            )
+
+        with self._get_connection() as conn:
+            # Дата истечения с точностью до дня попадает в [now, cutoff] при
+            # pwdLastSet в [now - 90 дней, cutoff + 1 день - 90 дней)
+            pwd_last_set_from = to_filetime(now - PASSWORD_MAX_AGE)
+            pwd_last_set_to = to_filetime(expiration_cutoff_date + timedelta(days=1) - PASSWORD_MAX_AGE) - 1
+
+            records = paged_search(
+                conn,
+                self.base_dn,
+                (
+                    "(&(objectClass=user)"
+                    f"(pwdLastSet>={pwd_last_set_from})(pwdLastSet<={pwd_last_set_to})"
+                    f"(!(userAccountControl:{LDAP_MATCHING_RULE_BIT_AND}:={UAC_ACCOUNT_DISABLED})))"
+                ),
+                ["sAMAccountName", "pwdLastSet", "displayName"]
+            )
+            return self._collect_expiring(records, now, expiration_cutoff_date)
+
+    def get_users_crossing_thresholds(self, thresholds: Iterable[int]) -> List[Dict]:
+        """Gets users whose passwords expire within the largest threshold.
+
+        Each entry has the expiring report format plus "days_remaining" and
+        "threshold" - the smallest threshold not below days_remaining. A day
+        the check did not run is caught up on the next one; repeats of the
+        same (user, expiry date, threshold) are dropped by the notification journal.
+        Raises if AD cannot be queried, so the caller can tell "nobody" from a failure.
+        """
+        thresholds = sorted(set(thresholds))
+        if not thresholds:
+            return []
+        today = datetime.now(pytz.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        cutoff = today + timedelta(days=thresholds[-1])
+        if self._usable_store() is not None:
+            expiring = self._collect_expiring(
+                self.expiry_index.expiring_between(today.date(), cutoff.date()), today, cutoff
+            )
+        else:
+            expiring = self._find_expiring_passwords(thresholds[-1])
+
+        users = []
+        for user in expiring:
+            expiry_date = datetime.strptime(user["password_expiry_date"], "%d.%m.%Y").replace(tzinfo=pytz.utc)
+            days_remaining = (expiry_date - today).days
+            threshold = next((threshold for threshold in thresholds if threshold >= days_remaining), None)
+            if threshold is not None:
+                users.append({**user, "days_remaining": days_remaining, "threshold": threshold})
+        return users
+
     def get_users_with_expired_passwords(self) -> List[Dict]:
         """Gets users whose passwords have expired."""
+        now = datetime.now(timezone.utc)
+        logging.debug(f"Поиск пользователей с истёкшим паролем")
+
+        store = self._usable_store()
+        if store is not None:
+            return self._collect_expired(self._stored_password_records(store), now)
+
         try:
             with self._get_connection() as conn:
-                now = datetime.now(timezone.utc)
+                # Пароль истёк, если pwdLastSet + 90 дней < now
+                pwd_last_set_to = to_filetime(now - PASSWORD_MAX_AGE) - 1
 
-                conn.search(
-                    search_base=self.base_dn,
-                    search_filter="(&(objectClass=user)(pwdLastSet=*))",
-                    attributes=[
+                records = paged_search(
+                    conn,
+                    self.base_dn,
+                    (
+                        f"(&(objectClass=user)(pwdLastSet<={pwd_last_set_to})"
+                        f"(!(userAccountControl:{LDAP_MATCHING_RULE_BIT_AND}:={UAC_ACCOUNT_DISABLED})))"
+                    ),
+                    [
                         "sAMAccountName",
                         "pwdLastSet",
                         "displayName",
                         "userAccountControl",
                         "distinguishedName"
-                    ],
-                    paged_size=1000
+                    ]
                 )
-                logging.debug(f"Поиск пользователей с истёкшим паролем")
-                expired_users = []
-
-                for entry in conn.entries:
-                    pwd_last_set = entry.pwdLastSet.value
-                    password_expiry_date = pwd_last_set + timedelta(days=90)
-
-                    if now > password_expiry_date:
-                        expired_users.append({
-                            "username": entry.sAMAccountName,
-                            "display_name": entry.displayName,
-                            "distinguished_name": entry.distinguishedName,
-                            "password_expiry_date": password_expiry_date.strftime("%d.%m.%Y"),
-                            "userAccountControl": entry.userAccountControl
-                        })
-
-                return expired_users
+                return self._collect_expired(records, now)
 
         except Exception as e:
             logging.error(f"Ошибка при поиске пользователей: {e}")
@@ -275,46 +833,24 @@ class ADConnector:
 
     def get_upcoming_birthdays(self, days: int = 30) -> List[Dict]:
         """Gets users with birthdays in the next specified number of days."""
+        logging.debug(f"Поиск пользователей у которых день рождения близжайшие {days} дней")
         try:
+            store = self._usable_store()
+            if store is not None:
+                return self._collect_birthdays(
+                    (record for record in store.records() if record.birthday),
+                    days
+                )
+
             with self._get_connection() as conn:
                 search_filter = "(&(objectClass=user)(extensionAttribute1=*))"
-                conn.search(
+                records = paged_search(
+                    conn,
                     self.base_dn,
                     search_filter,
-                    attributes=["sAMAccountName", "displayName", "extensionAttribute1", "mail"]
+                    ["sAMAccountName", "displayName", "extensionAttribute1", "mail"]
                 )
-                logging.debug(f"Поиск пользователей у которых день рождения близжайшие {days} дней")
-                yandex_users = self.ya360.get_yandex_users()
-                today = datetime.now()
-                future_date = today + timedelta(days=days)
-                upcoming_birthdays = []
-
-                for entry in conn.entries:
-                    birthday_str = entry.extensionAttribute1.value
-                    try:
-                        birthday = datetime.strptime(birthday_str, "%d.%m.%Y")
-                        birthday_this_year = birthday.replace(year=today.year)
-
-                        if birthday_this_year < today:
-                            birthday_this_year = birthday_this_year.replace(year=today.year + 1)
-
-                        user_id = yandex_users.get(entry.mail.value)
-
-                        if today <= birthday_this_year <= future_date:
-                            upcoming_birthdays.append({
-                                "username": entry.sAMAccountName.value,
-                                "display_name": entry.displayName.value,
-                                "email": entry.mail.value,
-                                "user_id": user_id,
-                                "birthday": birthday_this_year.strftime("%d.%m.%Y")
-                            })
-
-                    except ValueError:
-                        logging.debug(
-                            f"Неверный формат даты для пользователя {entry.sAMAccountName.value}: {birthday_str}"
-                        )
-
-                return upcoming_birthdays
+                return self._collect_birthdays(records, days)
 
         except Exception as e:
             logging.error(f"Ошибка при подключении к AD: {e}")
@@ -323,27 +859,25 @@ class ADConnector:
     def get_user_dn(self, login: str) -> str:
         """Returns the DN of a user by their UPN (login)."""
         try:
+            account = self.resolve_login(login)
+            if account is None:
+                raise ValueError(f"Пользователь с логином {login} не найден.")
+            # DN читаем с контроллера: после переноса учётки хранилище может быть ещё не обновлено
             with self._get_connection() as conn:
-                logging.debug(f"Поиск DN пользователя {login}")
-                # search_filter = f"(userPrincipalName={login})"
-                # conn.search(self.base_dn, search_filter, attributes=["distinguishedName"])
-                if conn.search(
+                logging.debug(f"Поиск DN пользователя {account}")
+                conn.search(
                     self.base_dn,
-                    f"(sAMAccountName={login})",
+                    f"(sAMAccountName={escape_filter_chars(account)})",
                     attributes=["distinguishedName"]
-                ):
-                    logging.debug(f"Ответ AD: {conn.entries}")
-                    if len(conn.entries) == 1:
-                        logging.debug(f"DN пользователя: {conn.entries[0].distinguishedName.value}")
-                        return conn.entries[0].distinguishedName.value
-
-                    alias = self.ya360.get_user_alias(login)
-                    if alias:
-                        return self.get_user_dn(f"{alias}@test.ru")
-
-                    raise ValueError(
-                        f"Пользователь с логином {login} не найден или найдено несколько записей."
-                    )
+                )
+                logging.debug(f"Ответ AD: {conn.entries}")
+                if len(conn.entries) == 1:
+                    logging.debug(f"DN пользователя: {conn.entries[0].distinguishedName.value}")
+                    return conn.entries[0].distinguishedName.value
+
+            raise ValueError(
+                f"Пользователь с логином {login} не найден или найдено несколько записей."
+            )
         except Exception as e:
             raise ValueError(f"Ошибка при получении DN пользователя: {e}")
 
@@ -351,11 +885,12 @@ class ADConnector:
         """Changes the password for a user in Active Directory."""
         # new_password = utils.generate_random_string()
         try:
-            with self._get_connection(use_ssl=True, for_password_change=True) as conn:
+            # DN ищем заранее, чтобы не держать соединение для смены паролей во время поиска
+            user_dn = self.get_user_dn(login)
+            with self._get_connection(for_password_change=True) as conn:
                 logging.debug(f"Изменение пароля пользователю {login}")
-                conn.start_tls()
                 conn.extend.microsoft.modify_password(
-                    self.get_user_dn(login),
+                    user_dn,
                     new_password=new_password
                 )
                 if conn.result["result"] == 0:
@@ -368,23 +903,13 @@ class ADConnector:
             return f"Ошибка смены пароля: {e}"
         
     def check_admin(self, user_login: str):
-        username = user_login.split("@")[0]
-        # Проверяем кэш
-        if username in self._admin_cache:
-            is_admin, cache_time = self._admin_cache[username]
-            if self._is_cache_valid(cache_time):
-                if not is_admin:
-                    raise AccessException()
-                return
-        
-        # Если кэша нет или он устарел, проверяем через AD
+        username = user_login.split("@")[0].lower()
         try:
-            is_admin = self.user_in_group(username, self._get_admin_group_dn())
-            # Обновляем кэш
-            self._admin_cache[username] = (is_admin, datetime.now())
-            
-            if not is_admin:
-                raise AccessException()
-            
-        except Exception as e:
-            raise AccessException()
\ No newline at end of file
+            is_admin = self._admin_cache.get_or_load(
+                username,
+                lambda: self.user_in_group(username, self._get_admin_group_dn())
+            )
+        except Exception:
+            raise AccessException()
+        if not is_admin:
+            raise AccessException()
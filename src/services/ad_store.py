@@ -0,0 +1,130 @@
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from services.ad_search import ADUserRecord
+
+
+class ADUserStore:
+    """In-process replica of AD user records indexed by sAMAccountName, mail and DN.
+
+    Records are keyed by objectGUID so renames and moves replace the old
+    entry. Index keys are lowercase.
+    """
+
+    def __init__(self):
+        self._by_guid: Dict[str, ADUserRecord] = {}
+        self._by_username: Dict[str, ADUserRecord] = {}
+        self._by_mail: Dict[str, ADUserRecord] = {}
+        self._by_dn: Dict[str, ADUserRecord] = {}
+        # Водяной знак синхронизации: highestCommittedUSN и контроллер, к которому он относится
+        self.highest_usn: Optional[int] = None
+        self.dc: Optional[str] = None
+        self.synced_at: Optional[datetime] = None
+        self._synced_monotonic: Optional[float] = None
+        self._full_loaded_monotonic: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.synced_at is not None
+
+    def age(self) -> float:
+        """Seconds since the last successful sync (infinite if never synced)."""
+        if self._synced_monotonic is None:
+            return float("inf")
+        return time.monotonic() - self._synced_monotonic
+
+    def full_age(self) -> float:
+        """Seconds since the last full load (infinite if never loaded)."""
+        if self._full_loaded_monotonic is None:
+            return float("inf")
+        return time.monotonic() - self._full_loaded_monotonic
+
+    @staticmethod
+    def key(record: ADUserRecord) -> str:
+        return str(record.object_guid or record.distinguished_name).lower()
+
+    def _index(self, record: ADUserRecord):
+        self._by_guid[self.key(record)] = record
+        if record.username:
+            self._by_username[record.username.lower()] = record
+        if record.mail:
+            self._by_mail[record.mail.lower()] = record
+        if record.distinguished_name:
+            self._by_dn[record.distinguished_name.lower()] = record
+
+    def _unindex(self, record: ADUserRecord):
+        for index, value in (
+                (self._by_username, record.username),
+                (self._by_mail, record.mail),
+                (self._by_dn, record.distinguished_name)):
+            if value and index.get(value.lower()) is record:
+                del index[value.lower()]
+
+    def _mark_synced(self, highest_usn: int, dc: str):
+        self.highest_usn = highest_usn
+        self.dc = dc
+        self.synced_at = datetime.now(timezone.utc)
+        self._synced_monotonic = time.monotonic()
+
+    def replace(self, records: Iterable[ADUserRecord], highest_usn: int, dc: str):
+        """Replaces the whole store after a full load."""
+        with self._lock:
+            self._by_guid, self._by_username, self._by_mail, self._by_dn = {}, {}, {}, {}
+            for record in records:
+                self._index(record)
+            self._mark_synced(highest_usn, dc)
+            self._full_loaded_monotonic = self._synced_monotonic
+
+    def apply(self, records: Iterable[ADUserRecord], highest_usn: int, dc: str) -> int:
+        """Upserts changed records. Returns the number of records applied."""
+        applied = 0
+        with self._lock:
+            for record in records:
+                previous = self._by_guid.get(self.key(record))
+                if previous is not None:
+                    self._unindex(previous)
+                self._index(record)
+                applied += 1
+            self._mark_synced(highest_usn, dc)
+        return applied
+
+    def export_meta(self) -> Dict[str, Any]:
+        """Returns the sync watermark for persisting next to the records."""
+        return {
+            "highest_usn": self.highest_usn,
+            "dc": self.dc,
+            "synced_at": self.synced_at.isoformat() if self.synced_at else None,
+            "full_age": self.full_age(),
+        }
+
+    def restore(self, records: Iterable[ADUserRecord], meta: Dict[str, Any], age: float):
+        """Loads a persisted snapshot that was saved age seconds ago."""
+        with self._lock:
+            self._by_guid, self._by_username, self._by_mail, self._by_dn = {}, {}, {}, {}
+            for record in records:
+                self._index(record)
+            self.highest_usn = meta["highest_usn"]
+            self.dc = meta["dc"]
+            self.synced_at = datetime.fromisoformat(meta["synced_at"])
+            now = time.monotonic()
+            self._synced_monotonic = now - age
+            self._full_loaded_monotonic = now - age - meta["full_age"]
+
+    def get(self, login: str) -> Optional[ADUserRecord]:
+        return self._by_username.get(login.lower())
+
+    def get_by_mail(self, mail: str) -> Optional[ADUserRecord]:
+        return self._by_mail.get(mail.lower())
+
+    def get_by_dn(self, dn: str) -> Optional[ADUserRecord]:
+        return self._by_dn.get(dn.lower())
+
+    def records(self) -> List[ADUserRecord]:
+        with self._lock:
+            return list(self._by_guid.values())
+
+    def __len__(self) -> int:
+        return len(self._by_guid)
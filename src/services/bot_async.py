@@ -0,0 +1,177 @@
+import asyncio
+import concurrent.futures
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import aiohttp
+from yandex_bot import Button
+from yandex_bot.apihelpers import BASE_URL
+
+from config import settings
+from exceptions import BotApiException
+from services.bot_client import build_send_payload, messenger_limiter
+from services.rate_limiter import current_priority, with_priority
+
+# Таймауты запросов к API бота, сек
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(sock_connect=3.0, sock_read=30.0)
+# Пауза после ошибки получения обновлений, сек
+POLL_ERROR_DELAY = 10.0
+
+
+class AsyncBotRuntime:
+    """Asyncio runtime for DispatchingClient.
+
+    Updates are polled and messages are sent over one keep-alive aiohttp
+    session. Handlers stay synchronous and run in a bounded executor; the
+    updates of one login are chained, so they run strictly in order, and
+    the handler is picked right before it runs.
+    """
+
+    def __init__(self, client, workers: int = None, max_pending: int = None, poll_limit: int = None):
+        self.client = client
+        self.workers = workers or settings.BOT_HANDLER_WORKERS
+        self.max_pending = max_pending or settings.BOT_HANDLER_QUEUE_SIZE
+        self.poll_limit = poll_limit or settings.BOT_POLL_LIMIT
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="bot_handler")
+        # Последняя задача каждого логина: следующая ждёт её завершения
+        self._tails: Dict[str, asyncio.Task] = {}
+        self._stats = {
+            "polls": 0, "poll_errors": 0, "updates": 0, "completed": 0, "failed": 0,
+            "sent": 0, "send_errors": 0, "pending": 0,
+            "wait_total": 0.0, "wait_max": 0.0, "run_total": 0.0, "run_max": 0.0,
+        }
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Сессия привязана к циклу событий, создаём её внутри него
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers={"Authorization": f"OAuth {self.client.api_key}"},
+                connector=aiohttp.TCPConnector(limit=self.workers, ssl=None if self.client.ssl_verify else False),
+                timeout=REQUEST_TIMEOUT,
+            )
+        return self._session
+
+    async def _request(self, method: str, path: str, params: Dict = None, data: Dict = None) -> Dict:
+        async with self._get_session().request(method, f"{BASE_URL}{path}", params=params, json=data) as response:
+            if response.status != 200:
+                raise BotApiException(response.status, await response.text())
+            return await response.json()
+
+    async def get_updates(self) -> List[Dict]:
+        data = await self._request(
+            "GET", "/messages/getUpdates", params={"offset": self.client.last_update_id + 1, "limit": self.poll_limit}
+        )
+        return data["updates"]
+
+    async def send_message(self, text: str, login: str = "", chat_id: str = "",
+                           inline_keyboard: List[Button] = None, **kwargs) -> int:
+        """Sends a text message, same arguments as Client.send_message."""
+        data = build_send_payload(text, login, chat_id, inline_keyboard, **kwargs)
+        # Полоса берётся из контекста: ответы обработчиков идут раньше фоновых рассылок
+        await messenger_limiter.acquire_async()
+        try:
+            result = await self._request("POST", "/messages/sendText/", data=data)
+        except Exception:
+            self._stats["send_errors"] += 1
+            raise
+        self._stats["sent"] += 1
+        return result["message_id"]
+
+    def send_message_threadsafe(self, *args, **kwargs) -> int:
+        """Sends a message from a handler or background thread through the runtime loop.
+
+        Raises TimeoutError if it is not sent within BOT_SEND_TIMEOUT seconds.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            with_priority(self.send_message(*args, **kwargs), current_priority()), self.loop
+        )
+        try:
+            return future.result(settings.BOT_SEND_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            # Цикл завис или перегружен: не держим поток и не оставляем отправку в очереди
+            future.cancel()
+            self._stats["send_errors"] += 1
+            raise TimeoutError(f"Сообщение не отправлено за {settings.BOT_SEND_TIMEOUT} с")
+
+    async def _handle(self, previous: Optional[asyncio.Task], json_message: Dict, queued_at: float):
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            wait = time.monotonic() - queued_at
+            self._stats["wait_total"] += wait
+            self._stats["wait_max"] = max(self._stats["wait_max"], wait)
+            started = time.monotonic()
+            try:
+                await self.loop.run_in_executor(self._executor, self.client._handle_update, json_message)
+            except Exception as e:
+                self._stats["failed"] += 1
+                logging.error(f"Ошибка обработки сообщения от {json_message.get('from', {}).get('login')}: {e}")
+            else:
+                self._stats["completed"] += 1
+            run = time.monotonic() - started
+            self._stats["run_total"] += run
+            self._stats["run_max"] = max(self._stats["run_max"], run)
+        finally:
+            self._stats["pending"] -= 1
+            self._slots.release()
+
+    def _submit(self, key: str, json_message: Dict):
+        task = self.loop.create_task(self._handle(self._tails.get(key), json_message, time.monotonic()))
+        self._tails[key] = task
+        self._stats["pending"] += 1
+
+        def forget(done: asyncio.Task):
+            if self._tails.get(key) is done:
+                del self._tails[key]
+
+        task.add_done_callback(forget)
+
+    async def poll(self):
+        """Polls updates until the client is closed."""
+        self._slots = asyncio.Semaphore(self.max_pending)
+        while not self.client.is_closed:
+            try:
+                updates = await self.get_updates()
+                self._stats["polls"] += 1
+                self.client.last_poll_at = time.monotonic()
+            except Exception as e:
+                self._stats["poll_errors"] += 1
+                logging.error(f"Ошибка получения обновлений бота: {e}")
+                await asyncio.sleep(POLL_ERROR_DELAY)
+                continue
+            for json_message in updates:
+                self.client.last_update_id = json_message["update_id"]
+                chat = json_message.get("chat") or {}
+                if chat.get("type") == "channel" and chat.get("id") in self.client.exclude_channels:
+                    continue
+                # Очередь полна: не забираем новые обновления, пока обработчики не освободятся
+                await self._slots.acquire()
+                self._stats["updates"] += 1
+                self._submit(json_message.get("from", {}).get("login") or chat.get("id", ""), json_message)
+            if not updates:
+                await asyncio.sleep(self.client.timeout)
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        # Пока цикл работает, send_message клиента отправляет через общую сессию
+        self.client.runtime = self
+        try:
+            await self.poll()
+        finally:
+            self.client.runtime = None
+            if self._session is not None:
+                await self._session.close()
+
+    def run(self):
+        """Runs the polling loop in the current thread until the client is closed."""
+        logging.info("Бот запущен в режиме asyncio")
+        asyncio.run(self._main())
+
+    def stats(self) -> Dict[str, float]:
+        """Returns poll, handler and send counters and wait/run times in seconds."""
+        return {**self._stats, "keys": len(self._tails), "workers": self.workers}
@@ -0,0 +1,106 @@
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+import requests
+import yandex_bot.apihelpers as api
+from yandex_bot import Button, Client
+
+from config import settings
+from exceptions import BotApiException
+from services.dispatcher import KeyedDispatcher
+from services.rate_limiter import TokenBucketLimiter
+
+# Общий лимит отправки сообщений ботом: уведомления идут в фоновой полосе
+# и уступают ответам пользователям
+messenger_limiter = TokenBucketLimiter(settings.BOT_SEND_RATE, settings.BOT_SEND_BURST)
+# Таймауты отправки сообщений в режиме потоков (соединение, чтение), сек
+SEND_TIMEOUT = (3.0, 30.0)
+
+
+def build_send_payload(text: str, login: str = "", chat_id: str = "",
+                       inline_keyboard: List[Button] = None, **kwargs) -> Dict:
+    """Builds the sendText request body, same arguments as Client.send_message."""
+    if not chat_id and not login:
+        raise Exception("Please provide login or chat_id")
+    data = {"text": text}
+    data.update(api.clear_kwargs_values({
+        "login": login,
+        "chat_id": chat_id,
+        "inline_keyboard": [button.to_dict() for button in inline_keyboard or []],
+        **kwargs,
+    }))
+    return data
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Tells whether a failed send may succeed on retry: network errors, timeouts, 429 and 5xx."""
+    if isinstance(error, BotApiException):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (requests.exceptions.RequestException, aiohttp.ClientError, ConnectionError, TimeoutError))
+
+
+class DispatchingClient(Client):
+    """Bot client that runs handlers on a worker pool instead of the polling thread.
+
+    Updates of one login are handled strictly in order. The handler is
+    picked right before it runs, so a next step handler registered by the
+    previous message of the same user is always seen.
+    """
+
+    def __init__(self, api_key: str, dispatcher: KeyedDispatcher = None, **kwargs):
+        super().__init__(api_key, **kwargs)
+        self.dispatcher = dispatcher or KeyedDispatcher(
+            settings.BOT_HANDLER_WORKERS, settings.BOT_HANDLER_QUEUE_SIZE, name="bot_handler"
+        )
+        # AsyncBotRuntime, если бот запущен в режиме asyncio
+        self.runtime = None
+        # Время последнего успешного опроса (time.monotonic()) для проверки готовности
+        self.last_poll_at: Optional[float] = None
+        # Keep-alive сессия для отправки: в отличие от библиотеки, сохраняет код ответа в ошибке
+        self._http = requests.Session()
+        self._http.headers["Authorization"] = f"OAuth {api_key}"
+
+    def run(self):
+        self.dispatcher.start()
+        super().run()
+
+    def _get_updates(self):
+        data = api.get_updates(self, self.last_update_id + 1)
+        self.last_poll_at = time.monotonic()
+        for json_message in data:
+            self.last_update_id = json_message["update_id"]
+            chat = json_message.get("chat") or {}
+            if chat.get("type") == "channel" and chat.get("id") in self.exclude_channels:
+                continue
+            key = json_message.get("from", {}).get("login") or chat.get("id", "")
+            self.dispatcher.submit(key, self._handle_update, json_message)
+
+    def _handle_update(self, json_message: dict):
+        handler = self._get_handler_for_message(json_message)
+        message = self._get_message_objects(json_message)
+        self._run_handler(handler, message)
+
+    def send_message(self, text: str, login: str = "", chat_id: str = "",
+                     inline_keyboard: List[Button] = None, **kwargs) -> int:
+        """Sends a text message, same arguments as Client.send_message.
+
+        Raises BotApiException with the HTTP status if the API rejects the request.
+        """
+        runtime = self.runtime
+        if runtime is not None:
+            return runtime.send_message_threadsafe(text, login, chat_id, inline_keyboard, **kwargs)
+        data = build_send_payload(text, login, chat_id, inline_keyboard, **kwargs)
+        messenger_limiter.acquire()
+        response = self._http.post(
+            f"{api.BASE_URL}/messages/sendText/", json=data, verify=self.ssl_verify, timeout=SEND_TIMEOUT
+        )
+        if response.status_code != 200:
+            raise BotApiException(response.status_code, response.text)
+        return response.json()["message_id"]
+
+    def handler_stats(self):
+        """Returns handler queue depth and wait/run times of the active runtime."""
+        if self.runtime is not None:
+            return self.runtime.stats()
+        return self.dispatcher.stats()
@@ -0,0 +1,93 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Tuple
+
+
+class KeyedDispatcher:
+    """Bounded worker pool that runs tasks in parallel across keys and in order within a key.
+
+    A key is owned by at most one worker at a time. After each task the key
+    goes to the back of the ready queue, so a user with many pending
+    messages does not hold a worker while others wait.
+    """
+
+    def __init__(self, workers: int, max_pending: int, name: str = "dispatcher"):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.name = name
+        # Ожидающие задачи по ключам и очередь ключей, готовых к обработке
+        self._pending: Dict[str, Deque[Tuple[float, Callable, tuple]]] = {}
+        self._ready: Deque[str] = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stats = {
+            "submitted": 0, "completed": 0, "failed": 0, "busy": 0,
+            "wait_total": 0.0, "wait_max": 0.0, "run_total": 0.0, "run_max": 0.0,
+        }
+
+    def start(self) -> List[threading.Thread]:
+        """Starts the worker threads once; later calls return the running ones."""
+        if self._threads:
+            return self._threads
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}_{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self._threads
+
+    def submit(self, key: str, func: Callable, *args):
+        """Queues func(*args) after earlier tasks of the same key. Blocks while the queue is full."""
+        with self._cond:
+            while self._size >= self.max_pending:
+                self._cond.wait()
+            tasks = self._pending.get(key)
+            if tasks is None:
+                # Ключа нет в очереди и его никто не обрабатывает
+                tasks = self._pending[key] = deque()
+                self._ready.append(key)
+                self._cond.notify_all()
+            tasks.append((time.monotonic(), func, args))
+            self._size += 1
+            self._stats["submitted"] += 1
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._ready:
+                    self._cond.wait()
+                key = self._ready.popleft()
+                queued_at, func, args = self._pending[key].popleft()
+                self._size -= 1
+                wait = time.monotonic() - queued_at
+                self._stats["busy"] += 1
+                self._stats["wait_total"] += wait
+                self._stats["wait_max"] = max(self._stats["wait_max"], wait)
+                self._cond.notify_all()
+
+            started = time.monotonic()
+            failed = False
+            try:
+                func(*args)
+            except Exception as e:
+                failed = True
+                logging.error(f"{self.name}: ошибка обработки сообщения от {key}: {e}")
+
+            with self._cond:
+                run = time.monotonic() - started
+                self._stats["busy"] -= 1
+                self._stats["failed" if failed else "completed"] += 1
+                self._stats["run_total"] += run
+                self._stats["run_max"] = max(self._stats["run_max"], run)
+                if self._pending[key]:
+                    self._ready.append(key)
+                    self._cond.notify_all()
+                else:
+                    del self._pending[key]
+
+    def stats(self) -> Dict[str, float]:
+        """Returns queue depth, task counters and wait/run times in seconds."""
+        with self._cond:
+            return {**self._stats, "queued": self._size, "keys": len(self._pending), "workers": self.workers}
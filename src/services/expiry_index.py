@@ -0,0 +1,77 @@
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List
+
+from services.ad_search import ADUserRecord
+
+
+class PasswordExpiryIndex:
+    """Date-bucket index of password expiry dates (UTC) of enabled accounts.
+
+    Looking up the accounts expiring on a given day costs O(k) in the number
+    of accounts returned; a range costs O(days + k).
+    """
+
+    def __init__(self, max_age: timedelta, disabled_flag: int):
+        self.max_age = max_age
+        self.disabled_flag = disabled_flag
+        self._buckets: Dict[date, Dict[str, ADUserRecord]] = defaultdict(dict)
+        self._by_user: Dict[str, date] = {}
+        self._lock = threading.Lock()
+
+    def expiry_date(self, record: ADUserRecord) -> date:
+        return (record.pwd_last_set + self.max_age).date()
+
+    def _remove(self, key: str):
+        day = self._by_user.pop(key, None)
+        if day is None:
+            return
+        bucket = self._buckets.get(day)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self._buckets[day]
+
+    def _add(self, record: ADUserRecord):
+        if not record.username:
+            return
+        key = record.username.lower()
+        self._remove(key)
+        if not isinstance(record.pwd_last_set, datetime):
+            return
+        if (record.user_account_control or 0) & self.disabled_flag:
+            return
+        day = self.expiry_date(record)
+        self._buckets[day][key] = record
+        self._by_user[key] = day
+
+    def rebuild(self, records: Iterable[ADUserRecord]):
+        """Replaces the index after a full load (also drops deleted accounts)."""
+        with self._lock:
+            self._buckets, self._by_user = defaultdict(dict), {}
+            for record in records:
+                self._add(record)
+
+    def update(self, records: Iterable[ADUserRecord]):
+        """Moves changed accounts to their new buckets."""
+        with self._lock:
+            for record in records:
+                self._add(record)
+
+    def expiring_on(self, day: date) -> List[ADUserRecord]:
+        with self._lock:
+            return list(self._buckets.get(day, {}).values())
+
+    def expiring_between(self, first_day: date, last_day: date) -> List[ADUserRecord]:
+        """Returns accounts whose passwords expire in [first_day, last_day]."""
+        records = []
+        with self._lock:
+            day = first_day
+            while day <= last_day:
+                records.extend(self._buckets.get(day, {}).values())
+                day += timedelta(days=1)
+        return records
+
+    def __len__(self) -> int:
+        return len(self._by_user)
@@ -0,0 +1,60 @@
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional
+
+
+class GroupMembershipIndex:
+    """In-memory snapshot of transitive group members (lowercase sAMAccountName)."""
+
+    def __init__(self, groups: Iterable[str]):
+        self.groups = [group.lower() for group in groups]
+        self._members: Dict[str, FrozenSet[str]] = {}
+        self.loaded_at: Optional[float] = None
+        # Увеличивается при каждом изменении состава любой группы
+        self.version = 0
+        self._listeners: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def on_change(self, callback: Callable[[], None]):
+        """Registers a callback invoked after membership of any group changes."""
+        self._listeners.append(callback)
+
+    def tracks(self, group_dn: str) -> bool:
+        return group_dn.lower() in self._members
+
+    def is_member(self, login: str, group_dn: str) -> bool:
+        return login.lower() in self._members.get(group_dn.lower(), frozenset())
+
+    def members(self, group_dn: str) -> FrozenSet[str]:
+        return self._members.get(group_dn.lower(), frozenset())
+
+    def age(self) -> float:
+        """Returns snapshot age in seconds (infinite if never loaded)."""
+        if self.loaded_at is None:
+            return float("inf")
+        return time.monotonic() - self.loaded_at
+
+    def export(self) -> Dict[str, List[str]]:
+        return {group: sorted(logins) for group, logins in self._members.items()}
+
+    def restore(self, members: Dict[str, Iterable[str]], age: float):
+        """Loads a persisted snapshot that was saved age seconds ago."""
+        self.update(members)
+        self.loaded_at = time.monotonic() - age
+
+    def update(self, members: Dict[str, Iterable[str]]) -> bool:
+        """Replaces the snapshot. Returns True if any group membership changed."""
+        new_members = {
+            group.lower(): frozenset(login.lower() for login in logins)
+            for group, logins in members.items()
+        }
+        with self._lock:
+            changed = new_members != self._members
+            self._members = new_members
+            self.loaded_at = time.monotonic()
+            if changed:
+                self.version += 1
+        if changed:
+            for callback in self._listeners:
+                callback()
+        return changed
@@ -0,0 +1,122 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+Labels = Dict[str, str]
+
+
+class MetricsWriter:
+    """Collects samples and renders them in the Prometheus text format."""
+
+    def __init__(self, prefix: str = "yabot"):
+        self.prefix = prefix
+        self._metrics: Dict[str, Tuple[str, str, List[Tuple[Labels, float]]]] = {}
+
+    def add(self, name: str, value: float, labels: Labels = None, help: str = "", kind: str = "gauge"):
+        name = f"{self.prefix}_{name}"
+        if name not in self._metrics:
+            self._metrics[name] = (kind, help, [])
+        self._metrics[name][2].append((labels or {}, float(value)))
+
+    @staticmethod
+    def _escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    @classmethod
+    def _labels(cls, labels: Labels) -> str:
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{cls._escape(value)}"' for key, value in labels.items()) + "}"
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help, samples) in self._metrics.items():
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{self._labels(labels)} {value}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+class HealthServer:
+    """Embedded HTTP server for Nomad checks and Prometheus.
+
+    /healthz answers 200 while liveness() is true, /readyz while every
+    readiness check is true, /metrics renders what the collectors write.
+    """
+
+    def __init__(
+            self,
+            port: int,
+            liveness: Callable[[], bool],
+            readiness: Dict[str, Callable[[], bool]],
+            collectors: List[Callable[[MetricsWriter], None]],
+            host: str = "0.0.0.0"
+        ):
+        self.port = port
+        self.host = host
+        self.liveness = liveness
+        self.readiness = readiness
+        self.collectors = collectors
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @staticmethod
+    def _run_check(check: Callable[[], bool]) -> bool:
+        try:
+            return bool(check())
+        except Exception as e:
+            logging.error(f"Ошибка проверки готовности: {e}")
+            return False
+
+    def ready(self) -> Dict[str, bool]:
+        return {name: self._run_check(check) for name, check in self.readiness.items()}
+
+    def metrics(self) -> str:
+        writer = MetricsWriter()
+        for collect in self.collectors:
+            try:
+                collect(writer)
+            except Exception as e:
+                logging.error(f"Ошибка сбора метрик: {e}")
+        return writer.render()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status: int, body: str, content_type: str = "application/json"):
+                payload = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/healthz":
+                    alive = server._run_check(server.liveness)
+                    self._reply(200 if alive else 503, json.dumps({"alive": alive}))
+                elif path == "/readyz":
+                    checks = server.ready()
+                    self._reply(200 if all(checks.values()) else 503, json.dumps(checks))
+                elif path == "/metrics":
+                    self._reply(200, server.metrics(), "text/plain; version=0.0.4; charset=utf-8")
+                else:
+                    self._reply(404, json.dumps({"error": "not found"}))
+
+            def log_message(self, format, *args):
+                # Проверки Nomad приходят каждые несколько секунд, не засоряем лог
+                logging.debug(f"HTTP {self.address_string()} {format % args}")
+
+        return Handler
+
+    def start(self) -> threading.Thread:
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        thread = threading.Thread(target=self._server.serve_forever, name="health_server", daemon=True)
+        thread.start()
+        logging.info(f"Проверки и метрики доступны на порту {self.port}")
+        return thread
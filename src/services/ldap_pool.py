@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from ldap3 import BASE, NO_ATTRIBUTES, Connection, Server
+from ldap3.core.exceptions import LDAPCommunicationError, LDAPException
+
+
+class LDAPPoolTimeoutError(Exception):
+    """No pooled connection became available in time."""
+
+
+class LDAPConnectionPool:
+    """Thread-safe pool of pre-bound ldap3 connections for one set of credentials."""
+
+    def __init__(
+            self,
+            name: str,
+            server_factory: Callable[[], Server],
+            user: str,
+            password: str,
+            size: int = 4,
+            max_idle: float = 300,
+            health_check_interval: float = 30,
+            acquire_timeout: float = 10,
+            receive_timeout: Optional[int] = None,
+            on_connect: Optional[Callable[[Connection], None]] = None
+        ):
+        self.name = name
+        self.server_factory = server_factory
+        self.user = user
+        self.password = password
+        self.size = size
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self.receive_timeout = receive_timeout
+        self.on_connect = on_connect
+        # Свободные соединения и время их последнего использования, берём с конца (LIFO)
+        self._idle: Deque[Tuple[Connection, float]] = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._stats = {"created": 0, "reused": 0, "discarded": 0, "in_use": 0, "borrowed": 0, "busy_seconds": 0.0}
+        # Время последней успешной операции с сервером (time.monotonic()) для проверки готовности
+        self._last_ok: Optional[float] = None
+
+    def _mark_ok(self):
+        with self._lock:
+            self._last_ok = time.monotonic()
+
+    def _connect(self) -> Connection:
+        conn = Connection(
+            self.server_factory(),
+            user=self.user,
+            password=self.password,
+            auto_bind=True,
+            receive_timeout=self.receive_timeout,
+        )
+        if self.on_connect:
+            self.on_connect(conn)
+        with self._lock:
+            self._stats["created"] += 1
+            self._last_ok = time.monotonic()
+        logging.debug(f"Пул LDAP {self.name}: новое соединение с {conn.server}")
+        return conn
+
+    def _discard(self, conn: Connection):
+        with self._lock:
+            self._stats["discarded"] += 1
+        try:
+            conn.unbind()
+        except Exception:
+            pass
+
+    def _is_alive(self, conn: Connection) -> bool:
+        try:
+            alive = conn.search("", "(objectClass=*)", search_scope=BASE, attributes=NO_ATTRIBUTES)
+        except LDAPException:
+            return False
+        if alive:
+            self._mark_ok()
+        return alive
+
+    def _checkout(self) -> Connection:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, last_used = self._idle.pop()
+            idle_for = time.monotonic() - last_used
+            if conn.closed or not conn.bound or idle_for > self.max_idle:
+                self._discard(conn)
+                continue
+            if idle_for > self.health_check_interval and not self._is_alive(conn):
+                logging.info(f"Пул LDAP {self.name}: соединение не прошло проверку, пересоздаём")
+                self._discard(conn)
+                continue
+            with self._lock:
+                self._stats["reused"] += 1
+            return conn
+        return self._connect()
+
+    @contextmanager
+    def connection(self):
+        """Borrows a bound connection for the duration of the with-block."""
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise LDAPPoolTimeoutError(f"Пул LDAP {self.name}: нет свободных соединений")
+        try:
+            conn = self._checkout()
+            healthy = True
+            borrowed_at = time.monotonic()
+            with self._lock:
+                self._stats["in_use"] += 1
+            try:
+                yield conn
+            except LDAPCommunicationError:
+                # Соединение оборвано, в пул его не возвращаем
+                healthy = False
+                raise
+            else:
+                self._mark_ok()
+            finally:
+                with self._lock:
+                    self._stats["in_use"] -= 1
+                    self._stats["borrowed"] += 1
+                    self._stats["busy_seconds"] += time.monotonic() - borrowed_at
+                if healthy and not conn.closed and conn.bound:
+                    with self._lock:
+                        self._idle.append((conn, time.monotonic()))
+                else:
+                    self._discard(conn)
+        finally:
+            self._slots.release()
+
+    def ping(self) -> bool:
+        """Checks the server over a pooled connection."""
+        try:
+            with self.connection() as conn:
+                return self._is_alive(conn)
+        except Exception as e:
+            logging.error(f"Пул LDAP {self.name}: сервер недоступен: {e}")
+            return False
+
+    def stats(self) -> Dict[str, float]:
+        """Returns pool counters; last_ok_age is seconds since the last successful operation, None if none yet."""
+        with self._lock:
+            last_ok_age = time.monotonic() - self._last_ok if self._last_ok is not None else None
+            return {**self._stats, "idle": len(self._idle), "size": self.size, "last_ok_age": last_ok_age}
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _ in idle:
+            self._discard(conn)
@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+# Версия схемы журнала. В отличие от кэша на диске, журнал при смене версии
+# мигрируется, а не пересоздаётся: иначе пользователи получат уведомления повторно
+SCHEMA_VERSION = 1
+
+PENDING = "pending"
+SENT = "sent"
+DEAD = "dead"
+CANCELLED = "cancelled"
+
+
+def notification_key(user_data: Dict) -> Tuple[str, str, int]:
+    """Returns the (username, expiry_date, threshold) key of a notification."""
+    return user_data['username'].lower(), user_data['expiry_date'], int(user_data['threshold'])
+
+
+class NotificationJournal:
+    """SQLite journal of password notifications keyed by (username, expiry_date, threshold).
+
+    A notification is enqueued at most once per key. Pending ones survive a
+    restart; a crash between sending and mark_sent can repeat that one message.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn:
+            self._migrate(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        with conn:
+            if version < 1:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS notifications (
+                        username TEXT NOT NULL,
+                        expiry_date TEXT NOT NULL,
+                        threshold INTEGER NOT NULL,
+                        status TEXT NOT NULL,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        payload TEXT NOT NULL,
+                        error TEXT,
+                        created_at TEXT NOT NULL,
+                        updated_at TEXT NOT NULL,
+                        PRIMARY KEY (username, expiry_date, threshold)
+                    )
+                    """
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS notifications_status ON notifications (status)")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _execute(self, sql: str, params: tuple) -> int:
+        with self._lock, closing(self._connect()) as conn, conn:
+            return conn.execute(sql, params).rowcount
+
+    def enqueue(self, user_data: Dict) -> bool:
+        """Records a pending notification. Returns False if its key was already journaled."""
+        now = datetime.now().isoformat()
+        return self._execute(
+            "INSERT OR IGNORE INTO notifications "
+            "(username, expiry_date, threshold, status, attempts, payload, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, 0, ?, ?, ?)",
+            (*notification_key(user_data), PENDING, json.dumps(user_data, ensure_ascii=False), now, now)
+        ) == 1
+
+    def _set_status(self, user_data: Dict, status: str, error: str = None):
+        self._execute(
+            "UPDATE notifications SET status = ?, attempts = ?, error = ?, updated_at = ? "
+            "WHERE username = ? AND expiry_date = ? AND threshold = ?",
+            (status, user_data.get('attempt', 0) + 1, error, datetime.now().isoformat(), *notification_key(user_data))
+        )
+
+    def mark_sent(self, user_data: Dict):
+        self._set_status(user_data, SENT)
+
+    def mark_dead(self, user_data: Dict, error: str):
+        self._set_status(user_data, DEAD, error)
+
+    def mark_cancelled(self, user_data: Dict):
+        """Closes a pending notification that is no longer relevant, e.g. the password was changed."""
+        self._set_status(user_data, CANCELLED)
+
+    def mark_retry(self, user_data: Dict, error: str):
+        """Stores the failed attempt so a restart resumes with the same attempt count."""
+        self._set_status(user_data, PENDING, error)
+
+    def pending(self) -> List[Dict]:
+        """Returns notifications that were not delivered or dead-lettered yet."""
+        with self._lock, closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT payload, attempts FROM notifications WHERE status = ? ORDER BY created_at",
+                (PENDING,)
+            ).fetchall()
+        return [{**json.loads(payload), 'attempt': attempts} for payload, attempts in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock, closing(self._connect()) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM notifications GROUP BY status").fetchall()
+        return dict(rows)
+
+    def purge(self, keep_days: int) -> int:
+        """Deletes finished notifications whose password expired more than keep_days ago."""
+        cutoff = datetime.now() - timedelta(days=keep_days)
+        with self._lock, closing(self._connect()) as conn, conn:
+            rows = conn.execute(
+                "SELECT username, expiry_date, threshold FROM notifications WHERE status != ?", (PENDING,)
+            ).fetchall()
+            stale = [row for row in rows if datetime.strptime(row[1], "%d.%m.%Y") < cutoff]
+            conn.executemany(
+                "DELETE FROM notifications WHERE username = ? AND expiry_date = ? AND threshold = ?", stale
+            )
+        if stale:
+            logging.info(f"Журнал уведомлений: удалено {len(stale)} старых записей")
+        return len(stale)
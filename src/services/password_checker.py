@@ -1,57 +1,118 @@
 from yandex_bot import Client, Button
+from collections import deque
 from datetime import datetime
-import time
+import random
+import threading
 import pytz
 import logging
-from typing import Dict
-from queue import Queue as Queue, Empty as QueueEmpty
+from typing import Deque, Dict, List, Optional
+from queue import Queue as Queue
+
+from config import settings
+from services.ad_service import PASSWORD_MAX_AGE
+from services.bot_client import is_transient_error
+from services.notification_journal import NotificationJournal
+from services.rate_limiter import BACKGROUND, priority
 
 class PasswordExpiryChecker:
-    def __init__(self, bot, ad_connector, utilities):
+    def __init__(self, bot, ad_connector, utilities, journal: Optional[NotificationJournal] = None):
         self.bot = bot
         self.ad = ad_connector
         self.utils = utilities
+        # Журнал на диске: неотправленное переживает перезапуск, отправленное не повторяется
+        self.journal = journal
         self.moscow_tz = pytz.timezone('Europe/Moscow')
         self.logger = logging.getLogger(__name__)
         self.notification_queue = Queue()
-        
-    def check_expiring_passwords(self):
-        """Проверяет пароли пользователей и отправляет уведомления"""
+        # Уведомления, которые не удалось отправить за NOTIFY_MAX_ATTEMPTS попыток
+        self.dead_letters: Deque[Dict] = deque(maxlen=settings.NOTIFY_DEAD_LETTER_SIZE)
+        self._stats = {"sent": 0, "retried": 0, "dead": 0}
+        self._stats_lock = threading.Lock()
+
+    def check_expiring_passwords(self) -> bool:
+        """Проверяет пароли пользователей и отправляет уведомления.
+
+        Возвращает False, если не удалось получить список пользователей.
+        """
+        fetched = True
         try:
-            # Проверяем пароли, истекающие в ближайшие 7 дней
-            expiring_users = self.ad.get_users_with_expiring_passwords(days=7)
+            # Каждый пользователь получает уведомление по ближайшему порогу; повтор того же
+            # порога отсекает журнал, а пропущенный день догоняется при следующем запуске
+            expiring_users = self.ad.get_users_crossing_thresholds(settings.notify_thresholds)
             for user in expiring_users:
                 try:
-                    # Вычисляем количество дней до истечения
-                    expiry_date = datetime.strptime(user['password_expiry_date'], "%d.%m.%Y")
-                    now = datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
-                    days_remaining = (expiry_date - now).days
                     notification_data = {
                         'username': user['username'],
                         'display_name': user['display_name'],
-                        'days_remaining': days_remaining,
-                        'expiry_date': user['password_expiry_date']
+                        'days_remaining': user['days_remaining'],
+                        'expiry_date': user['password_expiry_date'],
+                        'threshold': user['threshold']
                     }
+                    if self.journal and not self.journal.enqueue(notification_data):
+                        # Уже в очереди или отправлено при предыдущем запуске
+                        continue
                     self.notification_queue.put(notification_data)
-                        
+
                 except Exception as e:
                     self.logger.error(f"Ошибка при обработке пользователя {user['username']}: {e}")
-                    
+
         except Exception as e:
             self.logger.error(f"Ошибка при получении списка пользователей с истекающими паролями: {e}")
+            fetched = False
 
-    def _send_notification(self, user_data: Dict):
-        """Отправляет уведомление пользователю"""
+        if self.journal:
+            try:
+                self.journal.purge(settings.NOTIFY_JOURNAL_KEEP_DAYS)
+            except Exception as e:
+                self.logger.error(f"Ошибка при очистке журнала уведомлений: {e}")
+        return fetched
+
+    def resume_pending(self) -> int:
+        """Возвращает в очередь уведомления, не отправленные до перезапуска"""
+        if not self.journal:
+            return 0
+        pending = self._drop_changed_passwords(self.journal.pending())
+        for user_data in pending:
+            self.notification_queue.put(user_data)
+        if pending:
+            self.logger.info(f"Из журнала возвращено в очередь {len(pending)} уведомлений")
+        return len(pending)
+
+    def _drop_changed_passwords(self, pending: List[Dict]) -> List[Dict]:
+        """Перечитывает пользователей из журнала одним пакетным запросом к AD и
+        закрывает уведомления тех, кто уже сменил пароль"""
+        if not pending:
+            return pending
         try:
-            days_word = self._get_days_word(user_data['days_remaining'])
-            
-            message = (
-                f"🔔 Уведомление о сроке действия пароля\n\n"
-                f"Уважаемый(ая) {user_data['display_name']}!\n\n"
-                f"Ваш пароль истекает через {user_data['days_remaining']} {days_word} "
-                f"({user_data['expiry_date']}).\n\n"
-            )
-            
+            records = self.ad.get_users({user_data['username'] for user_data in pending}, ["pwdLastSet"])
+        except Exception as e:
+            self.logger.error(f"Не удалось перечитать пользователей из журнала уведомлений: {e}")
+            return pending
+        actual = []
+        for user_data in pending:
+            record = records.get(user_data['username'])
+            if record is not None and isinstance(record.pwd_last_set, datetime):
+                expiry_date = (record.pwd_last_set + PASSWORD_MAX_AGE).strftime("%d.%m.%Y")
+                if expiry_date != user_data['expiry_date']:
+                    self.logger.info(f"Пользователь {user_data['username']} уже сменил пароль, уведомление отменено")
+                    self._journal("mark_cancelled", user_data)
+                    continue
+            actual.append(user_data)
+        return actual
+
+    def _send_notification(self, user_data: Dict):
+        """Отправляет уведомление пользователю, ошибки отправки пробрасываются"""
+        days_word = self._get_days_word(user_data['days_remaining'])
+
+        message = (
+            f"🔔 Уведомление о сроке действия пароля\n\n"
+            f"Уважаемый(ая) {user_data['display_name']}!\n\n"
+            f"Ваш пароль истекает через {user_data['days_remaining']} {days_word} "
+            f"({user_data['expiry_date']}).\n\n"
+        )
+
+        # Общий лимит отправки: уведомления уступают ответам пользователям
+        with priority(BACKGROUND):
             self.bot.send_message(
                 message,
                 f"{user_data['username']}@test.ru",
@@ -60,14 +121,11 @@ class PasswordExpiryChecker:
                     Button(text="🔄 Сброс пароля", phrase="self_res_pass")
                 ]
             )
-            
-            self.logger.info(
-                f"Уведомление отправлено пользователю {user_data['username']} "
-                f"(до истечения: {user_data['days_remaining']} дней)"
-            )
-            
-        except Exception as e:
-            self.logger.error(f"Ошибка при отправке уведомления пользователю {user_data['username']}: {e}")
+
+        self.logger.info(
+            f"Уведомление отправлено пользователю {user_data['username']} "
+            f"(до истечения: {user_data['days_remaining']} дней)"
+        )
 
     def _get_days_word(self, days: int) -> str:
         """Возвращает правильное склонение слова 'день'"""
@@ -78,15 +136,97 @@ class PasswordExpiryChecker:
         else:
             return "дней"
 
+    def _count(self, key: str):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _retry_delay(self, attempt: int) -> float:
+        delay = min(settings.NOTIFY_BACKOFF_MAX, settings.NOTIFY_BACKOFF_BASE * 2 ** attempt)
+        # Разброс, чтобы повторы после общего сбоя не пришли одной пачкой
+        return delay * random.uniform(0.5, 1.0)
+
+    def _requeue(self, user_data: Dict):
+        # Сначала кладём повтор, потом закрываем исходную задачу, чтобы join() не завершился раньше времени
+        self.notification_queue.put(user_data)
+        self.notification_queue.task_done()
+
+    def _deliver(self, user_data: Dict):
+        """Отправляет уведомление; при временной ошибке (сеть, 429, 5xx) планирует повтор,
+        иначе или после NOTIFY_MAX_ATTEMPTS попыток переносит его в dead_letters"""
+        attempt = user_data.get('attempt', 0)
+        try:
+            self._send_notification(user_data)
+        except Exception as e:
+            transient = is_transient_error(e)
+            if not transient or attempt + 1 >= settings.NOTIFY_MAX_ATTEMPTS:
+                if transient:
+                    self.logger.error(
+                        f"Уведомление пользователю {user_data['username']} не отправлено "
+                        f"за {attempt + 1} попыток: {e}"
+                    )
+                else:
+                    # Отклонённый запрос (4xx) при повторе не пройдёт
+                    self.logger.error(f"Уведомление пользователю {user_data['username']} отклонено: {e}")
+                self.dead_letters.append({**user_data, 'error': str(e), 'failed_at': datetime.now().isoformat()})
+                self._journal("mark_dead", user_data, str(e))
+                self._count("dead")
+                self.notification_queue.task_done()
+                return
+            delay = self._retry_delay(attempt)
+            self.logger.warning(
+                f"Ошибка при отправке уведомления пользователю {user_data['username']}: {e}. "
+                f"Повтор через {delay:.0f} с"
+            )
+            self._count("retried")
+            self._journal("mark_retry", user_data, str(e))
+            # Повтор ждёт в таймере, а не в рабочем потоке
+            timer = threading.Timer(delay, self._requeue, args=({**user_data, 'attempt': attempt + 1},))
+            timer.daemon = True
+            timer.start()
+            return
+        self._count("sent")
+        self._journal("mark_sent", user_data)
+        self.notification_queue.task_done()
+
+    def _journal(self, action: str, *args):
+        if not self.journal:
+            return
+        try:
+            getattr(self.journal, action)(*args)
+        except Exception as e:
+            self.logger.error(f"Ошибка записи в журнал уведомлений ({action}): {e}")
+
     def process_notification_queue(self):
-        """Обрабатывает очередь уведомлений"""
+        """Обрабатывает очередь уведомлений (цикл одного рабочего потока)"""
         while True:
+            user_data = self.notification_queue.get()
             try:
-                # Получаем уведомление из очереди
-                user_data = self.notification_queue.get(timeout=1)
-                self._send_notification(user_data)
-                self.notification_queue.task_done()
-            except QueueEmpty:
-                time.sleep(1)
+                self._deliver(user_data)
             except Exception as e:
-                self.logger.error(f"Ошибка при обработке очереди уведомлений: {e}")
\ No newline at end of file
+                self.logger.error(f"Ошибка при обработке очереди уведомлений: {e}")
+                self.notification_queue.task_done()
+
+    def start_workers(self, count: int = None) -> List[threading.Thread]:
+        """Запускает пул потоков отправки уведомлений"""
+        workers = []
+        for number in range(count or settings.NOTIFY_WORKERS):
+            worker = threading.Thread(
+                target=self.process_notification_queue,
+                name=f"notification_worker_{number}",
+                daemon=True
+            )
+            worker.start()
+            workers.append(worker)
+        return workers
+
+    def stats(self) -> Dict[str, int]:
+        """Возвращает счётчики отправки уведомлений"""
+        with self._stats_lock:
+            stats = {
+                **self._stats,
+                "queued": self.notification_queue.qsize(),
+                "dead_letters": len(self.dead_letters),
+            }
+        if self.journal:
+            stats["journal"] = self.journal.counts()
+        return stats
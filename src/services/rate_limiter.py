@@ -0,0 +1,141 @@
+import asyncio
+import contextvars
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict
+
+# Полосы приоритета: меньшее значение обслуживается первым
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_priority = contextvars.ContextVar("request_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(lane: int):
+    """Sets the request priority lane for the current thread or task."""
+    token = _priority.set(lane)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+async def with_priority(coro, lane: int):
+    """Awaits coro in the given lane.
+
+    Context of the calling thread is not carried into the event loop by
+    run_coroutine_threadsafe, so the lane is passed explicitly.
+    """
+    with priority(lane):
+        return await coro
+
+
+class TokenBucketLimiter:
+    """Token bucket shared between threads and event loops.
+
+    A request in a lower-priority lane waits while any request in a
+    higher-priority lane is waiting for a token.
+    """
+
+    # Как часто перепроверять ожидающих, если токен забрала более приоритетная полоса
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, rate: float, burst: int, lanes: int = 2):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._waiting = [0] * lanes
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _try_take(self, lane: int) -> float:
+        """Takes a token if possible. Returns 0 on success or seconds to wait otherwise."""
+        with self._lock:
+            self._refill()
+            if any(self._waiting[:lane]):
+                return self.POLL_INTERVAL
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return min((1 - self._tokens) / self.rate, self.POLL_INTERVAL)
+
+    def _set_waiting(self, lane: int, delta: int):
+        with self._lock:
+            self._waiting[lane] += delta
+
+    def acquire(self, lane: int = None):
+        """Blocks until a token is available."""
+        lane = current_priority() if lane is None else lane
+        self._set_waiting(lane, 1)
+        try:
+            while True:
+                wait = self._try_take(lane)
+                if not wait:
+                    return
+                time.sleep(wait)
+        finally:
+            self._set_waiting(lane, -1)
+
+    async def acquire_async(self, lane: int = None):
+        """Waits for a token without blocking the event loop."""
+        lane = current_priority() if lane is None else lane
+        self._set_waiting(lane, 1)
+        try:
+            while True:
+                wait = self._try_take(lane)
+                if not wait:
+                    return
+                await asyncio.sleep(wait)
+        finally:
+            self._set_waiting(lane, -1)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            self._refill()
+            return {
+                "tokens": round(self._tokens, 2),
+                "waiting_interactive": self._waiting[INTERACTIVE],
+                "waiting_background": self._waiting[BACKGROUND],
+            }
+
+
+class EndpointCounter:
+    """Counts requests, throttled responses and response time per endpoint."""
+
+    _ID_PATTERN = re.compile(r"/\d+(?=/|$)")
+
+    def __init__(self):
+        self._counts: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"requests": 0, "throttled": 0, "seconds": 0.0}
+        )
+        self._lock = threading.Lock()
+
+    @classmethod
+    def normalize(cls, endpoint: str) -> str:
+        """users/123/2fa?x=1 -> users/{id}/2fa"""
+        path = endpoint.split("?", 1)[0]
+        return cls._ID_PATTERN.sub("/{id}", path)
+
+    def record(self, endpoint: str, requests: int = 1, throttled: int = 0, seconds: float = 0.0):
+        key = self.normalize(endpoint)
+        with self._lock:
+            self._counts[key]["requests"] += requests
+            self._counts[key]["throttled"] += throttled
+            self._counts[key]["seconds"] += seconds
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {endpoint: dict(counts) for endpoint, counts in self._counts.items()}
@@ -0,0 +1,190 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services.rate_limiter import BACKGROUND, priority
+from services.warm_cache import WarmCache
+
+# Имя снимка с временем последних успешных запусков в кэше на диске
+STATE_SNAPSHOT = "scheduler"
+# Предел одного ожидания: после перевода системных часов расписание пересчитается не позже
+MAX_SLEEP = 300.0
+
+
+class Job:
+    """Scheduled callable: a daily time or a fixed interval, jitter and a concurrency limit."""
+
+    def __init__(self, name: str, func: Callable, interval: float = None, at: Tuple[int, int] = None,
+                 jitter: float = 0.0, max_instances: int = 1, catch_up: bool = False):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.at = at
+        self.jitter = jitter
+        self.catch_up = catch_up
+        self.max_instances = max_instances
+        self.last_run: Optional[float] = None
+        self.next_run: Optional[float] = None
+        self.stats = {"runs": 0, "failures": 0, "skipped": 0, "running": 0}
+        self._slots = threading.BoundedSemaphore(max_instances)
+
+    def _daily_slot(self, moment: datetime) -> datetime:
+        return moment.replace(hour=self.at[0], minute=self.at[1], second=0, microsecond=0)
+
+    def following(self, now: float) -> float:
+        """Returns the next trigger time after now, jitter included."""
+        if self.interval is not None:
+            due = now + self.interval
+        else:
+            moment = datetime.fromtimestamp(now)
+            slot = self._daily_slot(moment)
+            if slot <= moment:
+                slot += timedelta(days=1)
+            due = slot.timestamp()
+        return due + random.uniform(0, self.jitter)
+
+    def first(self, now: float) -> float:
+        """Returns the first trigger time after start, taking the last recorded run into account."""
+        if self.interval is not None:
+            if self.last_run is None:
+                return now + random.uniform(0, self.jitter)
+            return max(now, self.last_run + self.interval)
+        if self.catch_up and self.last_run is not None:
+            moment = datetime.fromtimestamp(now)
+            previous = self._daily_slot(moment)
+            if previous > moment:
+                previous -= timedelta(days=1)
+            if self.last_run < previous.timestamp():
+                # Процесс был остановлен в момент запуска: догоняем сразу
+                logging.info(f"Задача {self.name} пропустила запуск {previous:%d.%m %H:%M}, выполняем сейчас")
+                return now
+        return self.following(now)
+
+
+class Scheduler:
+    """Heap-based scheduler that sleeps until the next due job.
+
+    Each run gets its own thread; a job that is still running max_instances
+    times skips its turn. A run fails if func raises or returns False; only
+    successful runs are stored in the warm cache, so daily jobs missed or
+    failed before the process went down run on start.
+    Daily times use the server clock, like the previous schedule setup.
+    """
+
+    def __init__(self, state: Optional[WarmCache] = None):
+        self.state = state
+        self._jobs: Dict[str, Job] = {}
+        self._heap: List[Tuple[float, int, Job]] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_daily_job(self, name: str, func: Callable, at: str, jitter: float = 0.0,
+                      max_instances: int = 1, catch_up: bool = True) -> Job:
+        """Runs func every day at "HH:MM"."""
+        hour, minute = (int(part) for part in at.split(":"))
+        return self._add(Job(name, func, at=(hour, minute), jitter=jitter,
+                             max_instances=max_instances, catch_up=catch_up))
+
+    def add_interval_job(self, name: str, func: Callable, interval: float, jitter: float = 0.0,
+                         max_instances: int = 1) -> Job:
+        """Runs func every interval seconds, first right after start."""
+        return self._add(Job(name, func, interval=interval, jitter=jitter, max_instances=max_instances))
+
+    def _add(self, job: Job) -> Job:
+        with self._cond:
+            self._jobs[job.name] = job
+            if self._thread is not None:
+                self._push(job, job.first(time.time()))
+        return job
+
+    def _push(self, job: Job, due: float):
+        job.next_run = due
+        heapq.heappush(self._heap, (due, next(self._counter), job))
+        self._cond.notify()
+
+    def _load_state(self):
+        snapshot = self.state.load(STATE_SNAPSHOT) if self.state else None
+        if snapshot is None:
+            return
+        last_runs, _ = snapshot
+        for name, last_run in last_runs.items():
+            if name in self._jobs:
+                self._jobs[name].last_run = last_run
+
+    def _save_state(self):
+        if not self.state:
+            return
+        with self._cond:
+            last_runs = {name: job.last_run for name, job in self._jobs.items() if job.last_run is not None}
+        self.state.save(STATE_SNAPSHOT, last_runs)
+
+    def start(self) -> threading.Thread:
+        """Loads the last run times and starts the scheduler thread."""
+        with self._cond:
+            self._load_state()
+            now = time.time()
+            for job in self._jobs.values():
+                self._push(job, job.first(now))
+            self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    delay = self._heap[0][0] - time.time() if self._heap else MAX_SLEEP
+                    if delay <= 0:
+                        break
+                    self._cond.wait(min(delay, MAX_SLEEP))
+                _, _, job = heapq.heappop(self._heap)
+                self._push(job, job.following(time.time()))
+            self._dispatch(job)
+
+    def _dispatch(self, job: Job):
+        if not job._slots.acquire(blocking=False):
+            self._count(job, "skipped")
+            logging.warning(f"Задача {job.name} ещё выполняется, запуск пропущен")
+            return
+        self._count(job, "running")
+        threading.Thread(target=self._execute, args=(job,), name=f"job_{job.name}", daemon=True).start()
+
+    def _count(self, job: Job, key: str, delta: int = 1):
+        with self._cond:
+            job.stats[key] += delta
+
+    def _execute(self, job: Job):
+        started = time.time()
+        try:
+            # Задачи по расписанию уступают обработчикам сообщений в общих лимитах
+            with priority(BACKGROUND):
+                result = job.func()
+        except Exception as e:
+            self._count(job, "failures")
+            logging.error(f"Задача {job.name} завершилась с ошибкой: {e}")
+        else:
+            if result is False:
+                # Задача сама обработала ошибку, но запуск не считаем выполненным
+                self._count(job, "failures")
+                logging.warning(f"Задача {job.name} завершилась неудачно")
+                return
+            self._count(job, "runs")
+            job.last_run = started
+            self._save_state()
+        finally:
+            self._count(job, "running", -1)
+            job._slots.release()
+
+    def jobs(self) -> Dict[str, Dict]:
+        """Returns run counters and the last and next run times of every job."""
+        with self._cond:
+            return {
+                name: {**job.stats, "last_run": job.last_run, "next_run": job.next_run}
+                for name, job in self._jobs.items()
+            }
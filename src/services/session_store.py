@@ -0,0 +1,204 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from config import settings
+
+
+class MemorySessionBackend:
+    """Sessions in process memory, kept in least recently used order."""
+
+    def __init__(self):
+        self._data: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+
+    def load(self, key: str) -> Optional[Tuple[float, Dict]]:
+        entry = self._data.get(key)
+        if entry is not None:
+            self._data.move_to_end(key)
+        return entry
+
+    def save(self, key: str, expires_at: float, data: Dict):
+        self._data[key] = (expires_at, data)
+        self._data.move_to_end(key)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def evict(self, now: float, maxsize: int) -> int:
+        """Drops expired sessions, then the least recently used ones above maxsize."""
+        expired = [key for key, (expires_at, _) in self._data.items() if expires_at <= now]
+        for key in expired:
+            del self._data[key]
+        evicted = len(expired)
+        while len(self._data) > maxsize:
+            self._data.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteSessionBackend:
+    """Sessions in a local SQLite file, so they survive a restart.
+
+    The file belongs to one bot process: SessionStore serialises its
+    read-modify-write cycles with an in-process lock only.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    key TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    data TEXT NOT NULL
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    def load(self, key: str) -> Optional[Tuple[float, Dict]]:
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT expires_at, data FROM sessions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE sessions SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return row[0], json.loads(row[1])
+
+    def save(self, key: str, expires_at: float, data: Dict):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (key, expires_at, accessed_at, data) VALUES (?, ?, ?, ?)",
+                (key, expires_at, time.time(), json.dumps(data, ensure_ascii=False))
+            )
+
+    def delete(self, key: str):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def evict(self, now: float, maxsize: int) -> int:
+        with closing(self._connect()) as conn, conn:
+            evicted = conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+            evicted += conn.execute(
+                "DELETE FROM sessions WHERE key IN "
+                "(SELECT key FROM sessions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (maxsize,)
+            ).rowcount
+        return evicted
+
+    def __len__(self) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class SessionStore:
+    """Per-login conversation state with sliding TTL and a size limit.
+
+    Reads return copies; changes go through update(), so concurrent
+    handlers and background threads never share a mutable dict. Keys listed
+    in transient (e.g. a freshly generated password) stay in process memory
+    and are never written to a persistent backend, so they are lost on
+    restart. A store is meant for a single process.
+    """
+
+    # Как часто удалять истёкшие и лишние сессии, сек
+    EVICT_INTERVAL = 60
+
+    def __init__(self, backend=None, ttl: float = None, maxsize: int = None, transient: Iterable[str] = ()):
+        self.backend = backend if backend is not None else MemorySessionBackend()
+        self.ttl = ttl or settings.SESSION_TTL
+        self.maxsize = maxsize or settings.SESSION_MAX_SIZE
+        self.transient = frozenset(transient)
+        self._transient: Dict[str, Tuple[float, Dict]] = {}
+        self._lock = threading.RLock()
+        self._evicted_at = 0.0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _load(self, key: str, now: float) -> Optional[Dict]:
+        entry = self.backend.load(key)
+        if entry is None or entry[0] <= now:
+            return None
+        data = dict(entry[1])
+        transient = self._transient.get(key)
+        if transient is not None and transient[0] > now:
+            data.update(transient[1])
+        return data
+
+    def _save(self, key: str, data: Dict, now: float):
+        expires_at = now + self.ttl
+        persistent = {name: value for name, value in data.items() if name not in self.transient}
+        transient = {name: value for name, value in data.items() if name in self.transient}
+        self.backend.save(key, expires_at, persistent)
+        if transient:
+            self._transient[key] = (expires_at, transient)
+        else:
+            self._transient.pop(key, None)
+        if len(self.backend) > self.maxsize or now - self._evicted_at >= self.EVICT_INTERVAL:
+            self._evict(now)
+
+    def _evict(self, now: float):
+        self._evicted_at = now
+        self._stats["evictions"] += self.backend.evict(now, self.maxsize)
+        # Значения вытесненных сессий живут не дольше их TTL
+        for key in [key for key, (expires_at, _) in self._transient.items() if expires_at <= now]:
+            del self._transient[key]
+
+    def get(self, key: str) -> Dict:
+        """Returns a copy of the session, empty if there is none or it expired."""
+        with self._lock:
+            now = time.time()
+            data = self._load(key, now)
+            self._stats["hits" if data is not None else "misses"] += 1
+            if data is None:
+                return {}
+            # Скользящий срок: активная беседа не истекает посреди сценария
+            self._save(key, data, now)
+            return dict(data)
+
+    def get_or_create(self, key: str, factory: Callable[[], Dict] = dict) -> Dict:
+        """Returns a copy of the session, atomically creating it with factory() if missing."""
+        with self._lock:
+            now = time.time()
+            data = self._load(key, now)
+            self._stats["hits" if data is not None else "misses"] += 1
+            if data is None:
+                data = factory()
+            self._save(key, data, now)
+            return dict(data)
+
+    def update(self, key: str, **values) -> Dict:
+        """Atomically merges values into the session and returns its new copy."""
+        with self._lock:
+            now = time.time()
+            data = self._load(key, now) or {}
+            data.update(values)
+            self._save(key, data, now)
+            return dict(data)
+
+    def delete(self, key: str):
+        with self._lock:
+            self.backend.delete(key)
+            self._transient.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "size": len(self.backend)}
+
+
+def create_session_store(transient: Iterable[str] = ()) -> SessionStore:
+    """Builds the session store with the backend chosen by SESSION_BACKEND."""
+    if settings.SESSION_BACKEND == "sqlite":
+        return SessionStore(SQLiteSessionBackend(settings.SESSION_PATH), transient=transient)
+    return SessionStore(MemorySessionBackend(), transient=transient)
@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Версия схемы файла: при несовпадении таблицы пересоздаются, старые данные отбрасываются
+SCHEMA_VERSION = 1
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS snapshots (
+        name TEXT PRIMARY KEY,
+        saved_at REAL NOT NULL,
+        data TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ad_users (
+        guid TEXT PRIMARY KEY,
+        data TEXT NOT NULL
+    )
+    """,
+)
+
+
+class WarmCache:
+    """SQLite file with the last directory snapshots, used to answer right after a restart.
+
+    Named snapshots are stored as JSON documents; AD user records get their
+    own table so incremental syncs rewrite only changed rows.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    self._migrate(conn)
+                    self._ready = True
+        return conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        with conn:
+            if version != SCHEMA_VERSION:
+                if version:
+                    logging.info(f"Кэш на диске: схема {version} устарела, пересоздаём")
+                conn.execute("DROP TABLE IF EXISTS snapshots")
+                conn.execute("DROP TABLE IF EXISTS ad_users")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _write(self, action: str, fn) -> bool:
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with closing(self._connect()) as conn, conn:
+                fn(conn)
+            return True
+        except Exception as e:
+            logging.error(f"Кэш на диске: не удалось сохранить {action}: {e}")
+            return False
+
+    def save(self, name: str, data: Any) -> bool:
+        """Stores a JSON-serialisable snapshot under name."""
+        return self._write(name, lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO snapshots (name, saved_at, data) VALUES (?, ?, ?)",
+            (name, time.time(), json.dumps(data, ensure_ascii=False))
+        ))
+
+    def load(self, name: str) -> Optional[Tuple[Any, float]]:
+        """Returns (data, age in seconds) or None if the snapshot is missing or unreadable."""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with closing(self._connect()) as conn:
+                row = conn.execute(
+                    "SELECT saved_at, data FROM snapshots WHERE name = ?", (name,)
+                ).fetchone()
+        except Exception as e:
+            logging.error(f"Кэш на диске: не удалось прочитать {name}: {e}")
+            return None
+        if row is None:
+            return None
+        saved_at, payload = row
+        return json.loads(payload), max(0.0, time.time() - saved_at)
+
+    def save_ad_users(self, records: Iterable[Tuple[str, Dict]], meta: Dict, full: bool) -> bool:
+        """Writes AD user rows (guid, record dict) and the sync metadata in one transaction.
+
+        full=True replaces the table, otherwise rows are upserted.
+        """
+        def write(conn: sqlite3.Connection):
+            rows = [(guid, json.dumps(record, ensure_ascii=False)) for guid, record in records]
+            payload = json.dumps(meta, ensure_ascii=False)
+            if full:
+                conn.execute("DELETE FROM ad_users")
+            conn.executemany("INSERT OR REPLACE INTO ad_users (guid, data) VALUES (?, ?)", rows)
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots (name, saved_at, data) VALUES (?, ?, ?)",
+                ("ad_users", time.time(), payload)
+            )
+
+        return self._write("ad_users", write)
+
+    def load_ad_users(self) -> Optional[Tuple[List[Dict], Dict, float]]:
+        """Returns (record dicts, sync metadata, age in seconds) or None."""
+        meta = self.load("ad_users")
+        if meta is None:
+            return None
+        try:
+            with closing(self._connect()) as conn:
+                rows = conn.execute("SELECT data FROM ad_users").fetchall()
+        except Exception as e:
+            logging.error(f"Кэш на диске: не удалось прочитать ad_users: {e}")
+            return None
+        return [json.loads(data) for data, in rows], meta[0], meta[1]
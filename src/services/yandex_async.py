@@ -0,0 +1,408 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import aiohttp
+
+from config import settings
+from exceptions import Has2FAException, RateLimitException
+from services.cache import TTLCache
+from services.rate_limiter import BACKGROUND, current_priority, priority, with_priority
+from services.warm_cache import WarmCache
+from services.yandex_service import YandexDirectory, api360_limiter, api360_quota
+
+
+class AsyncYandex360:
+    """Asyncio client for Yandex 360 API with bounded request concurrency."""
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, concurrency: int = None, warm_cache: Optional[WarmCache] = None):
+        self.headers_360 = {"Authorization": f"OAuth {settings.API_TOKEN_360}"}
+        self.base_url = f"https://api360.yandex.net/directory/v1/org/{settings.ORG_ID}"
+        self.concurrency = concurrency or settings.YA360_CONCURRENCY
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._directory: Optional[YandexDirectory] = None
+        self._directory_lock: Optional[asyncio.Lock] = None
+        self._directory_task: Optional[asyncio.Task] = None
+        # Наличие защищённого телефона по ID пользователя
+        self.twofa_cache = TTLCache(settings.YA360_2FA_CACHE_TTL)
+        # Снимок каталога на диске для быстрого старта после перезапуска
+        self.warm_cache = warm_cache
+        # Новые и повторно использованные keep-alive соединения
+        self._connections = {"created": 0, "reused": 0}
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Сессия и примитивы синхронизации привязаны к циклу событий, создаём их внутри него
+        if self._session is None or self._session.closed:
+            trace = aiohttp.TraceConfig()
+            trace.on_connection_create_end.append(self._on_connection("created"))
+            trace.on_connection_reuseconn.append(self._on_connection("reused"))
+            self._session = aiohttp.ClientSession(
+                headers=self.headers_360,
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                trace_configs=[trace],
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._directory_lock = asyncio.Lock()
+        return self._session
+
+    def _on_connection(self, key: str):
+        async def count(session, context, params):
+            self._connections[key] += 1
+        return count
+
+    async def pool_stats(self) -> Dict[str, int]:
+        """Returns connection pool statistics: limit, acquired and idle connections, created and reused totals."""
+        stats = {"limit": self.concurrency, "acquired": 0, "idle": 0, **self._connections}
+        if self._session is not None and not self._session.closed:
+            connector = self._session.connector
+            # Публичных счётчиков у TCPConnector нет, читаем их в цикле событий клиента
+            stats["acquired"] = len(connector._acquired)
+            stats["idle"] = sum(len(connections) for connections in connector._conns.values())
+        return stats
+
+    def _timeout_for(self, endpoint: str) -> aiohttp.ClientTimeout:
+        read_timeout = settings.YA360_READ_TIMEOUT
+        if endpoint.startswith('users?'):
+            read_timeout = settings.YA360_DIRECTORY_READ_TIMEOUT
+        return aiohttp.ClientTimeout(sock_connect=settings.YA360_CONNECT_TIMEOUT, sock_read=read_timeout)
+
+    @staticmethod
+    def _retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return min(settings.YA360_BACKOFF_FACTOR * (2 ** attempt), 10.0)
+
+    async def _make_yandex_request(self, endpoint: str, method: str = 'get', data: Dict = None,
+                                   raise_errors: bool = False) -> Dict:
+        """Make a request to Yandex API.
+
+        Raises RateLimitException if API 360 keeps throttling after retries.
+        Other failures return {}, or are raised when raise_errors is set:
+        aiohttp.ClientResponseError carries the HTTP status of a rejected request.
+        """
+        session = self._get_session()
+        url = f"{self.base_url}/{endpoint}"
+        # POST не идемпотентен, его не повторяем
+        retries = settings.YA360_RETRIES if method.lower() != 'post' else 0
+        for attempt in range(retries + 1):
+            try:
+                await api360_limiter.acquire_async()
+                async with self._semaphore:
+                    started = time.monotonic()
+                    async with session.request(
+                        method.upper(), url, json=data, timeout=self._timeout_for(endpoint)
+                    ) as response:
+                        api360_quota.record(
+                            endpoint, throttled=response.status == 429, seconds=time.monotonic() - started
+                        )
+                        if response.status in self.RETRY_STATUSES and attempt < retries:
+                            delay = self._retry_delay(attempt, response.headers.get('Retry-After'))
+                        elif response.status == 429:
+                            logging.error(f"API 360 ограничивает запросы к {endpoint}")
+                            raise RateLimitException()
+                        else:
+                            response.raise_for_status()
+                            # DELETE может вернуть пустой ответ
+                            if not await response.read():
+                                return {}
+                            return await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= retries or isinstance(e, aiohttp.ClientResponseError):
+                    logging.error(f"Error making Yandex API request: {e}")
+                    if raise_errors:
+                        raise
+                    return {}
+                delay = self._retry_delay(attempt)
+            await asyncio.sleep(delay)
+        return {}
+
+    async def _fetch_all_users(self) -> Optional[List[Dict]]:
+        """Downloads all directory pages. Returns None if any page failed."""
+        first_page = await self._make_yandex_request(
+            f'users?page=1&perPage={settings.YA360_DIRECTORY_PAGE_SIZE}'
+        )
+        if 'users' not in first_page:
+            return None
+        pages = await asyncio.gather(*(
+            self._make_yandex_request(f'users?page={page}&perPage={settings.YA360_DIRECTORY_PAGE_SIZE}')
+            for page in range(2, int(first_page.get('pages', 1)) + 1)
+        ))
+        users = list(first_page['users'])
+        for users_data in pages:
+            if 'users' not in users_data:
+                return None
+            users.extend(users_data['users'])
+        return users
+
+    async def refresh_directory(self) -> bool:
+        """Reloads the directory snapshot. Keeps the previous one on failure."""
+        try:
+            users = await self._fetch_all_users()
+        except RateLimitException:
+            users = None
+        if users is None:
+            logging.error("Не удалось обновить каталог Yandex 360, используется предыдущий снимок")
+            return False
+        self._directory = YandexDirectory(users)
+        logging.info(f"Каталог Yandex 360 обновлён: {len(users)} пользователей")
+        if self.warm_cache:
+            await asyncio.get_running_loop().run_in_executor(None, self.warm_cache.save, "ya360_directory", users)
+        return True
+
+    def directory_loaded(self) -> bool:
+        """Tells whether a directory snapshot (fresh or restored from disk) is available."""
+        return self._directory is not None
+
+    def restore_directory(self) -> bool:
+        """Loads the directory snapshot saved before the last restart.
+
+        The snapshot keeps its real age, so it is revalidated in the background
+        on first use once older than YA360_DIRECTORY_TTL.
+        """
+        snapshot = self.warm_cache.load("ya360_directory") if self.warm_cache else None
+        if snapshot is None:
+            return False
+        users, age = snapshot
+        self._directory = YandexDirectory(users, age=age)
+        logging.info(f"Каталог Yandex 360 восстановлен с диска: {len(users)} пользователей (возраст {int(age)} с)")
+        return True
+
+    async def _refresh_directory_background(self):
+        with priority(BACKGROUND):
+            await self.refresh_directory()
+
+    async def _get_directory(self) -> YandexDirectory:
+        """Returns the directory snapshot, refreshing it in the background once the TTL expires."""
+        self._get_session()
+        if self._directory is None:
+            async with self._directory_lock:
+                if self._directory is None:
+                    await self.refresh_directory()
+            return self._directory or YandexDirectory([])
+
+        if self._directory.age() > settings.YA360_DIRECTORY_TTL and (
+                self._directory_task is None or self._directory_task.done()):
+            self._directory_task = asyncio.get_running_loop().create_task(self._refresh_directory_background())
+        return self._directory
+
+    async def get_user_by_surname(self, surname: str) -> Optional[str]:
+        """Get user ID by surname."""
+        user = (await self._get_directory()).by_last_name.get(surname)
+        return user['id'] if user else None
+
+    async def get_user_by_nickname(self, nickname: str) -> Optional[str]:
+        """Get user ID by nickname or messenger login (user@domain)."""
+        user = (await self._get_directory()).by_nickname.get(nickname.split("@")[0].lower())
+        return user['id'] if user else None
+
+    async def get_nickname_by_id(self, user_id: str) -> Optional[str]:
+        """Get nickname by user ID."""
+        user = (await self._get_directory()).by_id.get(user_id)
+        return str(user['nickname']) if user else None
+
+    async def get_fio_by_id(self, user_id: str) -> Optional[str]:
+        """Get full name by user ID."""
+        return (await self._get_directory()).fio(user_id)
+
+    async def disable_2fa(self, user_id: str) -> str:
+        """Disable 2FA for a user.
+
+        Errors other than 400 (no security phone) are raised.
+        """
+        nickname = await self.get_nickname_by_id(user_id)
+        self.twofa_cache.delete(user_id)
+        try:
+            response = await self._make_yandex_request(f'users/{user_id}/2fa', method='delete', raise_errors=True)
+        except aiohttp.ClientResponseError as e:
+            logging.info(f"Запрос удаление номера 2FA у {nickname}. Ответ: {e.status} {e.message}")
+            if e.status == 400:
+                return f"У аккаунта {nickname} отсутствует защищенный номер телефона"
+            raise
+        logging.info(f"Запрос удаление номера 2FA у {nickname}. Ответ: {str(response)}")
+        return f"2FA для {nickname} выключен"
+
+    async def view_blocked_users(self) -> str:
+        """View all blocked users."""
+        return (await self._get_directory()).blocked_users_report()
+
+    async def get_yandex_users(self) -> Dict[str, str]:
+        """Get Yandex users with their IDs."""
+        return (await self._get_directory()).emails()
+
+    async def get_avatar_id(self, user_id: str) -> Optional[str]:
+        """Get user's avatar ID."""
+        user_data = await self._make_yandex_request(f'users/{user_id}')
+        return user_data.get('avatarId')
+
+    async def get_user_alias(self, login: str) -> Optional[str]:
+        """Get Yandex user alias."""
+        return (await self._get_directory()).alias(login)
+
+    async def get_2fa_status(self, user_id: str, use_cache: bool = True) -> Optional[bool]:
+        """Returns hasSecurityPhone for a user ID, None if the request failed.
+
+        Only True is cached: a user who has just added a phone must not be
+        refused until the cache expires.
+        """
+        if use_cache and self.twofa_cache.get(user_id):
+            return True
+        response = await self._make_yandex_request(f'users/{user_id}/2fa')
+        has_phone = response.get('hasSecurityPhone')
+        if has_phone:
+            self.twofa_cache.set(user_id, True)
+        elif has_phone is False:
+            self.twofa_cache.delete(user_id)
+        return has_phone
+
+    async def get_2fa_statuses(
+            self,
+            user_ids: Iterable[str],
+            use_cache: bool = True,
+            concurrency: int = None,
+            timeout: float = None
+        ) -> Dict[str, Optional[bool]]:
+        """Fetches 2FA status for many users concurrently.
+
+        Statuses not fetched within timeout seconds are cancelled and reported as None.
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        limit = asyncio.Semaphore(concurrency or self.concurrency)
+
+        async def fetch(user_id: str) -> Optional[bool]:
+            async with limit:
+                try:
+                    return await self.get_2fa_status(user_id, use_cache=use_cache)
+                except RateLimitException:
+                    return None
+
+        tasks = [asyncio.ensure_future(fetch(user_id)) for user_id in user_ids]
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logging.warning(f"Статус 2FA не получен до истечения срока для {len(pending)} пользователей")
+            await asyncio.wait(pending)
+        return {
+            user_id: None if task in pending else task.result()
+            for user_id, task in zip(user_ids, tasks)
+        }
+
+    async def audit_2fa(self, timeout: float = None) -> Dict:
+        """Checks 2FA for every active employee and refreshes the 2FA cache.
+
+        Returns users without a security phone and users whose status could not
+        be fetched. Checks still running after timeout seconds are dropped and
+        the partial result is returned with timed_out set.
+        """
+        with priority(BACKGROUND):
+            return await self._audit_2fa(timeout)
+
+    async def _audit_2fa(self, timeout: float = None) -> Dict:
+        started = time.monotonic()
+        directory = await self._get_directory()
+        employees = [
+            user for user in directory.users
+            if user.get('isEnabled') and not user.get('isRobot')
+        ]
+        statuses = await self.get_2fa_statuses(
+            (user['id'] for user in employees),
+            use_cache=False,
+            concurrency=settings.YA360_2FA_AUDIT_CONCURRENCY,
+            timeout=max(0.0, timeout - (time.monotonic() - started)) if timeout is not None else None
+        )
+        timed_out = timeout is not None and time.monotonic() - started >= timeout
+        return {
+            'without_phone': [user for user in employees if statuses[user['id']] is False],
+            'failed': [user for user in employees if statuses[user['id']] is None],
+            'checked': employees,
+            'timed_out': timed_out,
+        }
+
+    async def has_2fa(self, login: str, use_cache: bool = True) -> Optional[bool]:
+        """Check if user has 2FA enabled."""
+        user_id = await self.get_user_by_nickname(login)
+        if not user_id:
+            return None
+        return await self.get_2fa_status(user_id, use_cache=use_cache)
+
+    async def check_2fa(self, login: str):
+        """Check if user has 2FA enabled."""
+        user_id = await self.get_user_by_nickname(login)
+        if not user_id:
+            return None
+
+        # None - статус не получен (ошибка API): не блокируем пользователя
+        if await self.get_2fa_status(user_id) is False:
+            raise Has2FAException()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+class SyncYandex360:
+    """Blocking facade over AsyncYandex360 for handler and scheduler threads.
+
+    The async client runs on its own event loop in a daemon thread, so the
+    facade can be called from handler threads.
+    """
+
+    def __init__(self, client: AsyncYandex360 = None, timeout: float = None):
+        self.aio = client or AsyncYandex360()
+        self.timeout = timeout or settings.YA360_SYNC_TIMEOUT
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="ya360_async_loop", daemon=True)
+        self._thread.start()
+
+    def run(self, coro, timeout: float = None):
+        """Runs a coroutine on the client loop and waits for its result.
+
+        Raises RateLimitException if API 360 does not answer within the timeout
+        (YA360_SYNC_TIMEOUT unless given).
+        """
+        timeout = timeout or self.timeout
+        future = asyncio.run_coroutine_threadsafe(with_priority(coro, current_priority()), self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            # Не оставляем запрос висеть в цикле после того, как вызывающий перестал ждать
+            future.cancel()
+            logging.error(f"API 360 не ответил за {timeout} с")
+            raise RateLimitException()
+
+    def audit_2fa(self) -> Dict:
+        """Runs the 2FA audit with its own YA360_2FA_AUDIT_TIMEOUT deadline instead of YA360_SYNC_TIMEOUT."""
+        deadline = settings.YA360_2FA_AUDIT_TIMEOUT
+        # Запас на выгрузку каталога и отмену незавершённых проверок
+        return self.run(self.aio.audit_2fa(deadline), timeout=deadline + self.timeout)
+
+    def __getattr__(self, name):
+        method = getattr(self.aio, name)
+        if not asyncio.iscoroutinefunction(method):
+            return method
+
+        def call(*args, **kwargs):
+            return self.run(method(*args, **kwargs))
+
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        return call
+
+    def quota_stats(self) -> Dict[str, Dict[str, int]]:
+        """Returns API 360 request counts per endpoint."""
+        return api360_quota.snapshot()
+
+    def close(self):
+        self.run(self.aio.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
@@ -1,8 +1,8 @@
 from yandex_bot import Client
-from exceptions import AccessException, Has2FAException
+from exceptions import AccessException, Has2FAException, RateLimitException
 from services.ad_service import ADConnector
 from services.utils import Utilities
-from services.yandex_service import Yandex360
+from services.yandex_async import SyncYandex360
 
 from templates.messages import Template
 
@@ -30,6 +30,13 @@ class MenuTemplate(Template):
                 user_login,
                 inline_keyboard=self.user_main_menu
             )
+        except RateLimitException:
+            # Не блокируем меню, если API 360 временно ограничивает запросы
+            self.bot.send_message(
+                "Выберите действие:",
+                user_login,
+                inline_keyboard=menu_keyboard
+            )
         except Has2FAException as e:
             self.bot.send_message(
                 "Для использования бота у вас должны быть включена двухфакторная аутентификация в Яндекс.\
@@ -1,26 +1,31 @@
 from datetime import datetime, timedelta
 import logging
+import re
 from yandex_bot import Client, Button
 
-from exceptions import AccessException
+from config import settings
+from exceptions import AccessException, RateLimitException
 
 from services.ad_service import ADConnector
+from services.session_store import SessionStore, create_session_store
 from services.utils import Utilities
-from services.yandex_service import Yandex360
+from services.yandex_async import SyncYandex360
 
 class Template:
     def __init__(
             self,
             bot: Client,
-            ya360: Yandex360,
+            ya360: SyncYandex360,
             utils: Utilities,
-            ad: ADConnector
+            ad: ADConnector,
+            sessions: SessionStore = None
         ):
         self.bot = bot
         self.ya360 = ya360
         self.utils = utils
         self.ad = ad
-        self.session = {}
+        # Состояние сценариев по логину; сгенерированный пароль не пишется на диск
+        self.sessions = sessions or create_session_store(transient=("password",))
         self.admin_main_menu = [
             Button(text="❔ информация", phrase="info"),
             Button(text="🔑 пароль", phrase="password"),
@@ -31,6 +36,7 @@ class Template:
         self.yandex_menu = [
             Button(text="🚧 Кол-во заблокированных пользователей", phrase="yandex_blocked_users"),
             Button(text="❎ Сброс номера для 2FA у пользователя", phrase="disable_2fa_phone"),
+            Button(text="🛡 Сотрудники без 2FA", phrase="yandex_2fa_audit"),
             Button(text="❌ Отмена", phrase="main_menu"),
         ]
 
@@ -47,13 +53,10 @@ class Template:
         ]
     
     def get_session(self, user_id):
-        if user_id not in self.session:
-            self.session[user_id] = {}
-        return self.session[user_id]
+        return self.sessions.get_or_create(user_id)
 
     def clear_session(self, user_id):
-        if user_id in self.session:
-            del self.session[user_id]
+        self.sessions.delete(user_id)
 
     def _send_admin_protected_message(self, user_login: str, message: str, keyboard=None) -> None:
         """
@@ -121,7 +124,7 @@ class Template:
         """
         is_support = self.ad.user_in_group(
             user_login.split("@")[0],
-            "CN=IT Техническая поддержка,OU=Security Groups,OU=MyBusiness,DC=tion,DC=local",
+            settings.AD_SUPPORT_GROUP_DN,
         )
         
         if is_support:
@@ -142,22 +145,70 @@ class Template:
             
         self.bot.send_message(message, user_login, inline_keyboard=keyboard)
 
+    def _show_employees_summary(self, user_login: str, account_names: list) -> None:
+        """
+        Краткая информация о паролях нескольких сотрудников одним пакетным запросом к AD
+        """
+        try:
+            records = self.ad.get_users(account_names, ["sAMAccountName", "displayName", "pwdLastSet"])
+        except Exception as e:
+            self.bot.send_message(
+                f"Ошибка подключения к AD: {e}",
+                user_login,
+                inline_keyboard=self.admin_main_menu
+            )
+            return
+        lines = []
+        for account_name in account_names:
+            record = records.get(account_name)
+            if record is None or not isinstance(record.pwd_last_set, datetime):
+                lines.append(f"**{account_name}**\nНе найден или отсутствует атрибут pwdLastSet.")
+                continue
+            last_password_change = record.pwd_last_set.replace(tzinfo=None).strftime("%d.%m.%Y %H:%M")
+            lines.append(
+                f"**{record.display_name or record.username}** ({record.username})\n"
+                f"{self._format_password_info(last_password_change)}"
+            )
+        formatted_message = "\n\n".join(lines) + f"\n\n__{self.ad.data_freshness()}__"
+        self.bot.send_message(formatted_message, user_login, inline_keyboard=self.admin_main_menu)
+
     def show_employee_info(self, message) -> None:
         try:
             self.ad.check_admin(message.user.login)
+            # Несколько логинов в одном сообщении: "@ivanov @petrov"
+            account_names = list(dict.fromkeys(re.findall(r"@([^\s,;@]+)", message.text)))
+            if len(account_names) > 1:
+                self._show_employees_summary(message.user.login, account_names)
+                return
             try:
                 account_name = message.text.split("@")[1]
             except ValueError:
                 account_name = message.text.split("@")[0]
+            try:
+                profile = self.ad.get_user_profile(account_name)
+            except Exception as e:
+                self.bot.send_message(
+                    f"Ошибка подключения к AD: {e}",
+                    message.user.login,
+                    inline_keyboard=self.admin_main_menu
+                )
+                return
+            if profile is None or not isinstance(profile.pwd_last_set, datetime):
+                self.bot.send_message(
+                    f"Пользователь {account_name} не найден или у него отсутствует атрибут pwdLastSet.",
+                    message.user.login,
+                    inline_keyboard=self.admin_main_menu
+                )
+                return
             info = {
-                'last_password_change': self.ad.get_password_expiry_date(account_name),
-                'created_at': self.ad.get_account_creation_date(account_name),
-                'last_logon': self.ad.get_last_logon(account_name)
+                'last_password_change': profile.pwd_last_set.replace(tzinfo=None).strftime("%d.%m.%Y %H:%M"),
+                'created_at': profile.when_created,
+                'last_logon': self.ad.get_last_logon(profile.login)
             }
-            
+
             formatted_message = self._format_user_info(**info)
-            session = self.get_session(message.user.login)
-            session['account_name'] = account_name
+            formatted_message += f"\n\n__{self.ad.data_freshness()}__"
+            self.sessions.update(message.user.login, account_name=account_name)
             self.bot.send_message(
                 formatted_message,
                 message.user.login,
@@ -189,7 +240,7 @@ class Template:
         session = self.get_session(message.user.login)
         account_name = session.get('account_name')
         password = self.utils.generate_random_string()
-        session['password'] = password
+        self.sessions.update(message.user.login, password=password)
         self.ad.change_password(account_name, password)
         self.bot.send_message(
             f'Пароль {account_name} сброшен на **{password}**\nХотите отправить новый пароль {account_name} в мессенджер?',
@@ -246,7 +297,7 @@ class Template:
     def reset_password_instruction_office(self, message):
         is_support = self.ad.user_in_group(
             message.user.login.split("@")[0],
-            "CN=IT Техническая поддержка,OU=Security Groups,OU=MyBusiness,DC=tion,DC=local",
+            settings.AD_SUPPORT_GROUP_DN,
         )
         if is_support:
             keyboard = self.admin_main_menu
@@ -262,7 +313,7 @@ class Template:
     def reset_password_instruction_remote(self, message):
         is_support = self.ad.user_in_group(
             message.user.login.split("@")[0],
-            "CN=IT Техническая поддержка,OU=Security Groups,OU=MyBusiness,DC=tion,DC=local",
+            settings.AD_SUPPORT_GROUP_DN,
         )
         if is_support:
             keyboard = self.admin_main_menu
@@ -289,7 +340,7 @@ class Template:
     def self_reset_pass_finally(self, message):
         is_support = self.ad.user_in_group(
             message.user.login.split("@")[0],
-            "CN=IT Техническая поддержка,OU=Security Groups,OU=MyBusiness,DC=tion,DC=local",
+            settings.AD_SUPPORT_GROUP_DN,
         )
         if is_support:
             keyboard = self.admin_main_menu
@@ -309,7 +360,8 @@ class Template:
             self.ad.check_admin(message.user.login)
             username = message.text.split("@", 1)[1]
             
-            if not self.ya360.has_2fa(username):
+            # Номер могли добавить недавно: статус берём из API, а не из кэша
+            if self.ya360.has_2fa(username, use_cache=False) is False:
                 response = f"У аккаунта {username} отсутствует защищенный номер телефона"
             else:
                 try:
@@ -331,6 +383,12 @@ class Template:
                 message.user.login,
                 inline_keyboard=self.user_main_menu
             )
+        except RateLimitException:
+            self.bot.send_message(
+                "API Яндекс 360 временно ограничивает запросы, повторите попытку позже",
+                message.user.login,
+                inline_keyboard=self.admin_main_menu
+            )
         except IndexError as e:
             self.bot.send_message(
                 f"Ошибка сброса номера 2FA: {e}",
@@ -395,15 +453,73 @@ class Template:
     def show_users_with_expired_passwords(self, user_login: str):
         users = self.ad.get_users_with_expired_passwords()
         formatted_users = self._format_expired_users_list(users)
+        formatted_users += f"__{self.ad.data_freshness()}__"
         self._send_admin_protected_message(user_login, formatted_users)
 
     def show_users_with_expiring_passwords(self, user_login: str):
         users = self.ad.get_users_with_expiring_passwords()
         formatted_users = self._format_expiring_users_list(users)
+        formatted_users += f"__{self.ad.data_freshness()}__"
         self._send_admin_protected_message(user_login, formatted_users)
 
     def show_yandex_blocked_users(self, user_login: str):
         self._send_admin_protected_message(
             user_login,
             self.ya360.view_blocked_users()
-        )
\ No newline at end of file
+        )
+
+    def _format_2fa_audit(self, audit: dict) -> str:
+        """
+        Форматирует отчёт о сотрудниках без защищённого номера телефона
+        """
+        without_phone = sorted(audit['without_phone'], key=lambda x: x['nickname'])
+
+        reply_text = f"Проверено сотрудников: {len(audit['checked'])}\n\n"
+        for user in without_phone:
+            reply_text += f"**{user['nickname']}** {user['email']}\n"
+        reply_text += f"\n{len(without_phone)} без защищённого номера телефона"
+        if audit['failed']:
+            reply_text += f"\nНе удалось проверить: {len(audit['failed'])}"
+        if audit.get('timed_out'):
+            reply_text += (
+                f"\nАудит остановлен через {int(settings.YA360_2FA_AUDIT_TIMEOUT)} с, "
+                f"отчёт неполный"
+            )
+        return reply_text
+
+    def show_2fa_audit(self, user_login: str):
+        try:
+            self.ad.check_admin(user_login)
+        except AccessException:
+            self.bot.send_message(
+                "Выберите действие:",
+                user_login,
+                inline_keyboard=self.user_main_menu
+            )
+            return
+        self.bot.send_message("Проверяю 2FA сотрудников...", user_login)
+        try:
+            report = self._format_2fa_audit(self.ya360.audit_2fa())
+        except RateLimitException:
+            report = "API Яндекс 360 временно ограничивает запросы, повторите попытку позже"
+        except Exception as e:
+            logging.error(f"Ошибка при аудите 2FA: {e}")
+            report = f"Ошибка при аудите 2FA: {e}"
+        self.bot.send_message(report, user_login, inline_keyboard=self.yandex_menu)
+
+    def send_2fa_audit_report(self) -> bool:
+        """
+        Плановый аудит 2FA: прогревает кэш статусов и отправляет отчёт в чат.
+        Неполный отчёт тоже отправляется; возвращает False, если аудит не удался
+        или не уложился в YA360_2FA_AUDIT_TIMEOUT
+        """
+        try:
+            audit = self.ya360.audit_2fa()
+            report = self._format_2fa_audit(audit)
+            logging.info(f"Аудит 2FA завершён. {report.splitlines()[-1]}")
+            if settings.YA360_2FA_AUDIT_CHAT_ID:
+                self.bot.send_message(report, chat_id=settings.YA360_2FA_AUDIT_CHAT_ID)
+        except Exception as e:
+            logging.error(f"Ошибка при аудите 2FA: {e}")
+            return False
+        return not audit['timed_out']
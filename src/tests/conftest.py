@@ -0,0 +1,19 @@
+import os
+import sys
+
+# Модули бота импортируются от каталога src, как при запуске main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Обязательные параметры config.py: тесты не обращаются к внешним сервисам
+for name, value in {
+    "YANDEX_BOT_TOKEN": "test",
+    "AD_SERVER": "ldap://127.0.0.1",
+    "AD_USER": "test",
+    "AD_PASSWORD": "test",
+    "AD_BASE_DN": "DC=test,DC=local",
+    "AD_USER_FOR_PASS_CHANGE": "test",
+    "AD_PASSWORD_FOR_PASS_CHANGE": "test",
+    "API_TOKEN_360": "test",
+    "ORG_ID": "1",
+}.items():
+    os.environ.setdefault(name, value)
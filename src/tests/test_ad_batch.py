@@ -0,0 +1,82 @@
+from contextlib import contextmanager
+
+import services.ad_service as ad_service
+from services.ad_search import ADUserRecord
+from services.ad_service import ADConnector
+from services.cache import TTLCache
+
+
+class FakeYandex360:
+    def __init__(self, aliases=None):
+        self.aliases = aliases or {}
+
+    def get_user_alias(self, login):
+        return self.aliases.get(login)
+
+
+def make_connector(monkeypatch, accounts, aliases=None):
+    """ADConnector without a server: searches answer from accounts and are recorded."""
+    connector = ADConnector.__new__(ADConnector)
+    connector.base_dn = "DC=test,DC=local"
+    connector.ya360 = FakeYandex360(aliases)
+    connector._login_cache = TTLCache(60)
+    connector._store_lookup = lambda account: None
+    connector.connections = 0
+
+    @contextmanager
+    def get_connection(for_password_change=False):
+        connector.connections += 1
+        yield object()
+
+    connector._get_connection = get_connection
+    connector.filters = []
+
+    def paged_search(conn, base_dn, search_filter, attributes):
+        connector.filters.append(search_filter)
+        for account in accounts:
+            if f"(sAMAccountName={ad_service.escape_filter_chars(account)})" in search_filter:
+                yield ADUserRecord(username=account, display_name=account.title())
+
+    monkeypatch.setattr(ad_service, "paged_search", paged_search)
+    return connector
+
+
+def test_search_accounts_splits_filter_into_batches(monkeypatch):
+    monkeypatch.setattr(ad_service.settings, "AD_BATCH_SIZE", 2)
+    accounts = ["u1", "u2", "u3", "u4", "u5"]
+    connector = make_connector(monkeypatch, accounts)
+
+    found = connector._search_accounts(object(), accounts, ["sAMAccountName"])
+
+    assert sorted(found) == accounts
+    assert len(connector.filters) == 3
+    assert connector.filters[0] == "(&(objectClass=user)(|(sAMAccountName=u1)(sAMAccountName=u2)))"
+    assert connector.filters[2] == "(&(objectClass=user)(|(sAMAccountName=u5)))"
+
+
+def test_search_accounts_escapes_filter_values(monkeypatch):
+    connector = make_connector(monkeypatch, [])
+
+    connector._search_accounts(object(), ["a*", "b)(objectClass=*", "c\\d"], ["sAMAccountName"])
+
+    assert connector.filters == [
+        "(&(objectClass=user)(|(sAMAccountName=a\\2a)"
+        "(sAMAccountName=b\\29\\28objectClass=\\2a)"
+        "(sAMAccountName=c\\5cd)))"
+    ]
+
+
+def test_get_users_is_keyed_by_login_and_uses_one_connection(monkeypatch):
+    connector = make_connector(monkeypatch, ["ivanov", "petrov"], aliases={"ivan": "ivanov@test.ru"})
+
+    users = connector.get_users(["ivanov@test.ru", "ivan@test.ru", "ghost@test.ru", "petrov"])
+
+    assert {login: record.username for login, record in users.items()} == {
+        "ivanov@test.ru": "ivanov",
+        "ivan@test.ru": "ivanov",
+        "petrov": "petrov",
+    }
+    assert connector.connections == 1
+    # Найденные и ненайденные логины попадают в общий кэш resolve_login
+    assert connector._login_cache.get("ivan") == "ivanov"
+    assert connector._login_cache.get("ghost", "missing") is None
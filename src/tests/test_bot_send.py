@@ -0,0 +1,53 @@
+import asyncio
+import threading
+
+import pytest
+from yandex_bot import Button
+
+import services.bot_async as bot_async
+from services.bot_async import AsyncBotRuntime
+from services.bot_client import build_send_payload, is_transient_error
+
+
+def test_payload_drops_empty_values_and_serialises_buttons():
+    data = build_send_payload("hi", login="u@test.ru", inline_keyboard=[Button(text="Ok", phrase="ok")],
+                              disable_notification=False)
+
+    assert data == {
+        "text": "hi",
+        "login": "u@test.ru",
+        "inline_keyboard": [Button(text="Ok", phrase="ok").to_dict()],
+    }
+
+
+def test_payload_requires_recipient():
+    with pytest.raises(Exception):
+        build_send_payload("hi")
+
+
+def test_threadsafe_send_times_out_when_loop_stalls(monkeypatch):
+    monkeypatch.setattr(bot_async.settings, "BOT_SEND_TIMEOUT", 0.1)
+    runtime = AsyncBotRuntime(client=None, workers=1, max_pending=1, poll_limit=1)
+    runtime.loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=runtime.loop.run_forever, daemon=True)
+    thread.start()
+    cancelled = threading.Event()
+
+    async def send_message(*args, **kwargs):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    runtime.send_message = send_message
+    try:
+        with pytest.raises(TimeoutError) as error:
+            runtime.send_message_threadsafe("hi", "u@test.ru")
+        # Уведомление с такой ошибкой уйдёт на повтор, а не в dead letters
+        assert is_transient_error(error.value)
+        assert cancelled.wait(1)
+        assert runtime.stats()["send_errors"] == 1
+    finally:
+        runtime.loop.call_soon_threadsafe(runtime.loop.stop)
+        thread.join(1)
@@ -0,0 +1,94 @@
+import threading
+import time
+
+from services.dispatcher import KeyedDispatcher
+
+
+def wait_for(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_tasks_of_one_key_run_in_order():
+    dispatcher = KeyedDispatcher(workers=4, max_pending=100)
+    dispatcher.start()
+    seen = {"a": [], "b": []}
+    running = {"a": 0, "b": 0}
+    overlaps = []
+
+    def task(key, number):
+        running[key] += 1
+        if running[key] > 1:
+            overlaps.append((key, number))
+        time.sleep(0.001)
+        seen[key].append(number)
+        running[key] -= 1
+
+    for number in range(30):
+        dispatcher.submit("a", task, "a", number)
+        dispatcher.submit("b", task, "b", number)
+
+    assert wait_for(lambda: dispatcher.stats()["completed"] == 60)
+    assert seen["a"] == list(range(30))
+    assert seen["b"] == list(range(30))
+    assert overlaps == []
+
+
+def test_different_keys_run_in_parallel():
+    dispatcher = KeyedDispatcher(workers=2, max_pending=10)
+    dispatcher.start()
+    both_started = threading.Barrier(2, timeout=2)
+    results = []
+
+    def task(key):
+        both_started.wait()
+        results.append(key)
+
+    dispatcher.submit("a", task, "a")
+    dispatcher.submit("b", task, "b")
+
+    assert wait_for(lambda: dispatcher.stats()["completed"] == 2)
+    assert sorted(results) == ["a", "b"]
+
+
+def test_failed_task_does_not_block_its_key():
+    dispatcher = KeyedDispatcher(workers=1, max_pending=10)
+    dispatcher.start()
+    done = []
+
+    def fail():
+        raise RuntimeError("boom")
+
+    dispatcher.submit("a", fail)
+    dispatcher.submit("a", done.append, "next")
+
+    assert wait_for(lambda: dispatcher.stats()["completed"] == 1)
+    assert done == ["next"]
+    assert dispatcher.stats()["failed"] == 1
+
+
+def test_submit_blocks_while_queue_is_full():
+    dispatcher = KeyedDispatcher(workers=1, max_pending=2)
+    dispatcher.start()
+    release = threading.Event()
+
+    dispatcher.submit("a", release.wait)
+    # Первая задача уже у рабочего потока, очередь пуста
+    assert wait_for(lambda: dispatcher.stats()["busy"] == 1)
+    dispatcher.submit("b", lambda: None)
+    dispatcher.submit("c", lambda: None)
+
+    blocked = threading.Thread(target=dispatcher.submit, args=("d", lambda: None), daemon=True)
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+    assert dispatcher.stats()["queued"] == 2
+
+    release.set()
+    blocked.join(2)
+    assert not blocked.is_alive()
+    assert wait_for(lambda: dispatcher.stats()["completed"] == 4)
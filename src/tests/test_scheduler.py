@@ -0,0 +1,95 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from services.scheduler import STATE_SNAPSHOT, Job, Scheduler
+from services.warm_cache import WarmCache
+
+NOON = datetime(2026, 10, 18, 12, 0)
+
+
+def wait_for(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def daily_job(last_run: datetime = None, catch_up: bool = True) -> Job:
+    job = Job("daily", lambda: None, at=(9, 0), catch_up=catch_up)
+    job.last_run = last_run.timestamp() if last_run else None
+    return job
+
+
+def test_missed_daily_run_is_caught_up_on_start():
+    job = daily_job(last_run=NOON - timedelta(days=1))
+    assert job.first(NOON.timestamp()) == NOON.timestamp()
+
+
+def test_daily_run_done_today_waits_for_tomorrow():
+    job = daily_job(last_run=NOON.replace(hour=9, minute=1))
+    assert job.first(NOON.timestamp()) == (NOON + timedelta(days=1)).replace(hour=9).timestamp()
+
+
+def test_missed_run_is_not_caught_up_without_catch_up():
+    job = daily_job(last_run=NOON - timedelta(days=1), catch_up=False)
+    assert job.first(NOON.timestamp()) == (NOON + timedelta(days=1)).replace(hour=9).timestamp()
+
+
+def test_job_without_recorded_run_waits_for_its_time():
+    job = daily_job()
+    assert job.first(NOON.timestamp()) == (NOON + timedelta(days=1)).replace(hour=9).timestamp()
+
+
+def test_running_job_skips_its_turn():
+    scheduler = Scheduler()
+    release = threading.Event()
+    job = scheduler.add_interval_job("slow", release.wait, interval=3600, max_instances=1)
+
+    scheduler._dispatch(job)
+    scheduler._dispatch(job)
+    assert scheduler.jobs()["slow"]["skipped"] == 1
+    assert scheduler.jobs()["slow"]["running"] == 1
+
+    release.set()
+    assert wait_for(lambda: scheduler.jobs()["slow"]["runs"] == 1)
+    scheduler._dispatch(job)
+    assert wait_for(lambda: scheduler.jobs()["slow"]["runs"] == 2)
+    assert scheduler.jobs()["slow"]["skipped"] == 1
+
+
+def test_failed_runs_are_not_recorded(tmp_path):
+    state = WarmCache(str(tmp_path / "cache.sqlite3"))
+    scheduler = Scheduler(state)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    raising = scheduler.add_interval_job("raising", fail, interval=3600)
+    returning_false = scheduler.add_interval_job("returning_false", lambda: False, interval=3600)
+    succeeding = scheduler.add_interval_job("succeeding", lambda: None, interval=3600)
+    for job in (raising, returning_false, succeeding):
+        scheduler._dispatch(job)
+
+    assert wait_for(lambda: all(stats["running"] == 0 for stats in scheduler.jobs().values()))
+    jobs = scheduler.jobs()
+    assert jobs["raising"]["failures"] == 1 and jobs["raising"]["last_run"] is None
+    assert jobs["returning_false"]["failures"] == 1 and jobs["returning_false"]["last_run"] is None
+    assert jobs["succeeding"]["runs"] == 1 and jobs["succeeding"]["last_run"] is not None
+    last_runs, _ = state.load(STATE_SNAPSHOT)
+    assert set(last_runs) == {"succeeding"}
+
+
+def test_start_runs_daily_job_missed_while_stopped(tmp_path):
+    state = WarmCache(str(tmp_path / "cache.sqlite3"))
+    state.save(STATE_SNAPSHOT, {"report": time.time() - 2 * 24 * 60 * 60})
+    scheduler = Scheduler(state)
+    ran = threading.Event()
+    at = (datetime.now() - timedelta(minutes=1)).strftime("%H:%M")
+    scheduler.add_daily_job("report", ran.set, at=at)
+
+    scheduler.start()
+    assert ran.wait(2)
+    assert wait_for(lambda: scheduler.jobs()["report"]["runs"] == 1)
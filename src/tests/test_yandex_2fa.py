@@ -0,0 +1,129 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from exceptions import Has2FAException
+from services.yandex_async import AsyncYandex360
+from services.yandex_service import YandexDirectory
+
+
+def make_client(statuses):
+    """AsyncYandex360 whose 2FA endpoint answers from the statuses list, one item per request."""
+    client = AsyncYandex360()
+    client._directory = YandexDirectory([{"id": "1", "nickname": "ivanov"}])
+    client.requests = 0
+
+    async def request(endpoint, method='get', data=None):
+        client.requests += 1
+        return {"hasSecurityPhone": statuses.pop(0)}
+
+    client._make_yandex_request = request
+    return client
+
+
+def run(client, scenario):
+    async def main():
+        try:
+            return await scenario()
+        finally:
+            await client.close()
+    return asyncio.run(main())
+
+
+def test_missing_phone_is_not_cached():
+    client = make_client([False, True])
+
+    async def scenario():
+        with pytest.raises(Has2FAException):
+            await client.check_2fa("ivanov@test.ru")
+        # Номер добавлен: следующая проверка снова идёт в API и пропускает пользователя
+        await client.check_2fa("ivanov@test.ru")
+
+    run(client, scenario)
+    assert client.requests == 2
+
+
+def test_confirmed_phone_is_cached():
+    client = make_client([True])
+
+    async def scenario():
+        await client.check_2fa("ivanov@test.ru")
+        await client.check_2fa("ivanov@test.ru")
+
+    run(client, scenario)
+    assert client.requests == 1
+
+
+def test_has_2fa_without_cache_refetches():
+    client = make_client([True, False])
+
+    async def scenario():
+        return [await client.has_2fa("ivanov", use_cache=False) for _ in range(2)]
+
+    assert run(client, scenario) == [True, False]
+    assert client.requests == 2
+
+
+def test_audit_returns_partial_result_after_deadline():
+    client = AsyncYandex360()
+    client._directory = YandexDirectory([
+        {"id": user_id, "nickname": user_id, "isEnabled": True, "isRobot": False}
+        for user_id in ("fast", "slow")
+    ])
+
+    async def request(endpoint, method='get', data=None):
+        if "slow" in endpoint:
+            await asyncio.sleep(10)
+        return {"hasSecurityPhone": False}
+
+    client._make_yandex_request = request
+
+    async def scenario():
+        return await client.audit_2fa(timeout=0.2)
+
+    audit = run(client, scenario)
+    assert audit['timed_out'] is True
+    assert [user['id'] for user in audit['without_phone']] == ["fast"]
+    assert [user['id'] for user in audit['failed']] == ["slow"]
+
+
+@pytest.mark.parametrize("status, reply", [
+    (200, "2FA для ivanov выключен"),
+    (400, "У аккаунта ivanov отсутствует защищенный номер телефона"),
+])
+def test_disable_2fa_branches_on_http_status(status, reply):
+    client = AsyncYandex360()
+    client._directory = YandexDirectory([{"id": "1", "nickname": "ivanov"}])
+
+    async def handler(request):
+        return web.json_response({}, status=status)
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_route("DELETE", "/users/1/2fa", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        client.base_url = "http://{}:{}".format(*runner.addresses[0][:2])
+        try:
+            return await client.disable_2fa("1")
+        finally:
+            await runner.cleanup()
+
+    assert run(client, scenario) == reply
+
+
+def test_disable_2fa_raises_other_client_errors():
+    client = AsyncYandex360()
+    client._directory = YandexDirectory([{"id": "1", "nickname": "ivanov"}])
+
+    async def request(endpoint, method='get', data=None, raise_errors=False):
+        assert raise_errors
+        raise aiohttp.ClientResponseError(None, (), status=403, message="Forbidden")
+
+    client._make_yandex_request = request
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        run(client, lambda: client.disable_2fa("1"))